@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'game.middleware.MetricsMiddleware',
+    'game.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,6 +86,36 @@ DATABASES = {
     }
 }
 
+# Профиль SQLite: 'production' - WAL, настроенные PRAGMA, постоянные соединения
+# и очередь записи (включается явно); пустое значение - настройки Django по умолчанию
+SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', '')
+
+if SQLITE_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Сколько ждать снятия блокировки записи вместо ошибки "database is locked" (сек)
+            'timeout': 20,
+            # Блокировка записи берется в начале транзакции, а не при первой записи -
+            # так параллельные транзакции ждут, а не падают при повышении блокировки
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA cache_size=-20000;'
+                'PRAGMA mmap_size=134217728;'
+                'PRAGMA temp_store=MEMORY;'
+            ),
+        },
+    })
+
+# Записи хода игрока выполняются одним потоком с групповой фиксацией (game.write_queue)
+DB_WRITE_QUEUE = SQLITE_PROFILE == 'production'
+DB_WRITE_BATCH = int(os.getenv('DB_WRITE_BATCH', 50))
+# Сколько ждать поток записи (сек) - дольше таймаута блокировки SQLite; не дождались - пишем сами
+DB_WRITE_TIMEOUT = float(os.getenv('DB_WRITE_TIMEOUT', 30))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -138,4 +170,121 @@ DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
 DEEPSEEK_API_URL = os.getenv('DEEPSEEK_API_URL', 'https://api.deepseek.com/v1/chat/completions')
 
 MAX_RETRIES = 3
-TIMEOUT = 30
\ No newline at end of file
+TIMEOUT = 30
+
+# Устойчивость клиента DeepSeek: общий бюджет времени на вызов (сек), задержки повторов,
+# предохранитель (сколько отказов подряд и на сколько секунд отключать API)
+# и дублирующие запросы после p95 задержки
+DEEPSEEK_LATENCY_BUDGET = float(os.getenv('DEEPSEEK_LATENCY_BUDGET', 20))
+DEEPSEEK_RETRY_BACKOFF = 0.5
+DEEPSEEK_RETRY_BACKOFF_MAX = 4
+DEEPSEEK_BREAKER_THRESHOLD = int(os.getenv('DEEPSEEK_BREAKER_THRESHOLD', 5))
+DEEPSEEK_BREAKER_RESET = float(os.getenv('DEEPSEEK_BREAKER_RESET', 30))
+DEEPSEEK_HEDGE = os.getenv('DEEPSEEK_HEDGE', '') == '1'
+DEEPSEEK_HEDGE_MIN_SAMPLES = 20
+
+# Склейка одинаковых одновременных запросов к ИИ:
+# 'process' - внутри процесса, 'db' - и между воркерами через таблицу аренд, 'off' - выключено
+LLM_SINGLEFLIGHT = os.getenv('LLM_SINGLEFLIGHT', 'process')
+LLM_SINGLEFLIGHT_LEASE = DEEPSEEK_LATENCY_BUDGET + 5
+LLM_SINGLEFLIGHT_RESULT_TTL = 2
+# Опрос чужой аренды (сек): первая пауза и предел, до которого она удваивается
+LLM_SINGLEFLIGHT_POLL_INTERVAL = 0.05
+LLM_SINGLEFLIGHT_POLL_MAX = 0.5
+
+# Пул keep-alive соединений к DeepSeek (общий для процесса клиент)
+DEEPSEEK_POOL_SIZE = int(os.getenv('DEEPSEEK_POOL_SIZE', 10))
+DEEPSEEK_CONNECT_TIMEOUT = float(os.getenv('DEEPSEEK_CONNECT_TIMEOUT', 5))
+DEEPSEEK_READ_TIMEOUT = float(os.getenv('DEEPSEEK_READ_TIMEOUT', TIMEOUT))
+
+# Общий кэш: версии страниц и таблиц лидеров, лимиты частоты, счетчик запросов к ИИ.
+# При нескольких воркерах нужен общий для них Redis (REDIS_URL, пакет redis),
+# иначе у каждого процесса свой кэш в памяти и сбросы версий до других не доходят
+REDIS_URL = os.getenv('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL},
+    }
+else:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    }
+# Отдельный кэш для DjangoCacheVerdictBackend: его clear() очищает псевдоним целиком,
+# поэтому для Redis это отдельная база (например, redis://host:6379/1)
+VERDICT_REDIS_URL = os.getenv('VERDICT_REDIS_URL', '')
+if VERDICT_REDIS_URL:
+    CACHES['verdicts'] = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': VERDICT_REDIS_URL}
+else:
+    CACHES['verdicts'] = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'verdicts'}
+
+# Кэш вердиктов по паре (ситуация, нормализованный план).
+# Для общего кэша между воркерами: 'game.verdict_cache.DjangoCacheVerdictBackend' и VERDICT_REDIS_URL
+VERDICT_CACHE_BACKEND = os.getenv('VERDICT_CACHE_BACKEND', 'game.verdict_cache.LocMemVerdictBackend')
+VERDICT_CACHE_ALIAS = 'verdicts'
+VERDICT_CACHE_SIZE = int(os.getenv('VERDICT_CACHE_SIZE', 10000))
+VERDICT_CACHE_TTL = int(os.getenv('VERDICT_CACHE_TTL', 24 * 60 * 60))
+
+# Индекс случайного выбора ситуаций: период перечитывания (сек) и веса категорий.
+# Пустой словарь - равномерный выбор по всем ситуациям
+SITUATION_INDEX_TTL = int(os.getenv('SITUATION_INDEX_TTL', 300))
+SITUATION_CATEGORY_WEIGHTS = {}
+
+# Пул заранее сгенерированных ситуаций (manage.py refill_situation_pool)
+SITUATION_POOL_WATERMARK = int(os.getenv('SITUATION_POOL_WATERMARK', 20))
+SITUATION_POOL_BATCH_SIZE = int(os.getenv('SITUATION_POOL_BATCH_SIZE', 10))
+SITUATION_POOL_WORKERS = int(os.getenv('SITUATION_POOL_WORKERS', 3))
+SITUATION_POOL_RATE = int(os.getenv('SITUATION_POOL_RATE', 30))
+
+# Минимальное сходство (оценка Жаккара по MinHash), с которого ситуация считается дублем
+SITUATION_DUPLICATE_THRESHOLD = float(os.getenv('SITUATION_DUPLICATE_THRESHOLD', 0.6))
+
+# Лимиты частоты запросов: {действие: {'player' | 'ip': (запросов в минуту, запас)}}
+RATE_LIMITS = {
+    'submit': {'player': (20, 5), 'ip': (60, 15)},
+    'generate': {'ip': (6, 3)},
+}
+# Не больше LLM_MAX_INFLIGHT одновременных запросов к API (0 - без ограничения). Места арендуются
+# в кэше Django на LLM_INFLIGHT_TTL сек; лимит общий для всех воркеров только с общим кэшем
+# (REDIS_URL), с LocMemCache он действует в каждом процессе отдельно
+LLM_MAX_INFLIGHT = int(os.getenv('LLM_MAX_INFLIGHT', 20))
+LLM_INFLIGHT_TTL = 300
+
+# Таблица лидеров: размер страницы и страховочный TTL кэша первой страницы (сек)
+LEADERBOARD_PAGE_SIZE = 10
+LEADERBOARD_CACHE_TTL = 60
+
+# Доступ к /metrics: персонал, адреса из METRICS_ALLOWED_IPS (через запятую)
+# или заголовок "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip]
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Снимки запросов (админка, "Снимки запросов"): доля запросов под cProfile,
+# порог медленного запроса (сек) и размер кольцевого буфера. Нули - выключено
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SLOW_THRESHOLD = float(os.getenv('PROFILE_SLOW_THRESHOLD', 0))
+PROFILE_BUFFER_SIZE = int(os.getenv('PROFILE_BUFFER_SIZE', 200))
+
+# Админка: до скольких строк считать точно; больше - оценка, а страницы ограничены этим числом
+ADMIN_COUNT_LIMIT = int(os.getenv('ADMIN_COUNT_LIMIT', 10000))
+
+# Локальная модель оценки планов (manage.py train_scorer); пустой путь - выключена
+SURVIVAL_SCORER_PATH = os.getenv('SURVIVAL_SCORER_PATH', str(BASE_DIR / 'survival_scorer.json'))
+# Вероятность, начиная с которой вердикт модели принимается без запроса к ИИ
+SURVIVAL_SCORER_CONFIDENCE = float(os.getenv('SURVIVAL_SCORER_CONFIDENCE', 0.9))
+# Как часто (сек) проверять, не переобучена ли модель
+SURVIVAL_SCORER_CHECK_INTERVAL = 10
+
+# Режим оценки действий: 'sync' - в запросе, 'async' - в фоновом пуле потоков,
+# 'stream' - потоковая выдача вердикта через Server-Sent Events (лучше под ASGI)
+EVALUATION_MODE = os.getenv('EVALUATION_MODE', 'sync')
+EVALUATION_WORKERS = int(os.getenv('EVALUATION_WORKERS', 4))
+# Ожидающее действие (сек): аренда оценки считается брошенной через EVALUATION_LEASE,
+# действие без аренды дольше EVALUATION_START_GRACE уходит на оценку в фон,
+# а старше EVALUATION_PENDING_TIMEOUT получает резервный вердикт
+EVALUATION_LEASE = int(os.getenv('EVALUATION_LEASE', 60))
+EVALUATION_START_GRACE = int(os.getenv('EVALUATION_START_GRACE', 5))
+EVALUATION_PENDING_TIMEOUT = int(os.getenv('EVALUATION_PENDING_TIMEOUT', 300))
+# Пачки планов в одном запросе к ИИ: до EVALUATION_BATCH_SIZE планов, собранных
+# за EVALUATION_BATCH_WINDOW сек (1 - без пачек). В режиме 'async' пачка не больше EVALUATION_WORKERS
+EVALUATION_BATCH_SIZE = int(os.getenv('EVALUATION_BATCH_SIZE', 1))
+EVALUATION_BATCH_WINDOW = float(os.getenv('EVALUATION_BATCH_WINDOW', 0.05))
@@ -1,21 +1,165 @@
+from django.conf import settings
 from django.contrib import admin
-from .models import Player, Situation, GameSession, PlayerAction
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db.models import Max, Min
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from django.utils.functional import cached_property
+from . import analytics
+from . import export
+from .models import ActionRollup, Player, Situation, GameSession, PlayerAction, RequestProfile
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор без COUNT(*) по всей таблице.
+
+    Без фильтров число строк оценивается по границам первичного ключа (два
+    чтения индекса), с фильтрами считается не дальше ADMIN_COUNT_LIMIT строк.
+    Страниц не больше, чем помещается в ADMIN_COUNT_LIMIT строк, - дальше
+    нужно сужать выборку фильтрами и иерархией дат, а не листать OFFSET.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            bounds = queryset.aggregate(first=Min('pk'), last=Max('pk'))
+            if bounds['first'] is None:
+                return 0
+            return bounds['last'] - bounds['first'] + 1
+        return queryset.order_by()[:settings.ADMIN_COUNT_LIMIT].count()
+
+    @cached_property
+    def num_pages(self):
+        max_pages = max(1, settings.ADMIN_COUNT_LIMIT // self.per_page)
+        return min(super().num_pages, max_pages)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список большой таблицы: оценка числа строк и без полного подсчета"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 
 @admin.register(Player)
-class PlayerAdmin(admin.ModelAdmin):
+class PlayerAdmin(LargeTableAdmin):
     list_display = ['name', 'created_at']
 
 @admin.register(Situation)
 class SituationAdmin(admin.ModelAdmin):
     list_display = ['category', 'text', 'created_by', 'created_at']
     list_filter = ['category', 'is_user_created']
+    list_select_related = ['created_by']
+    raw_id_fields = ['created_by']
 
 @admin.register(GameSession)
-class GameSessionAdmin(admin.ModelAdmin):
+class GameSessionAdmin(LargeTableAdmin):
     list_display = ['player', 'score', 'lives', 'is_active', 'created_at']
     list_filter = ['is_active']
+    list_select_related = ['player']
+    raw_id_fields = ['player', 'situation']
+    date_hierarchy = 'created_at'
 
 @admin.register(PlayerAction)
-class PlayerActionAdmin(admin.ModelAdmin):
-    list_display = ['game_session', 'survived', 'created_at']
-    list_filter = ['survived']
\ No newline at end of file
+class PlayerActionAdmin(LargeTableAdmin):
+    list_display = ['game_session', 'survived', 'verdict_source', 'created_at']
+    list_filter = ['survived', 'verdict_source']
+    # __str__ сессии и действия обращаются к игроку
+    list_select_related = ['game_session__player']
+    raw_id_fields = ['game_session', 'situation']
+    date_hierarchy = 'created_at'
+
+    def get_urls(self):
+        return [
+            path('export/', self.admin_site.admin_view(self.export_view), name='game_playeraction_export'),
+        ] + super().get_urls()
+
+    def export_view(self, request):
+        """Потоковая выгрузка истории: ?format=jsonl|csv&since=<id>, ответ сжат gzip"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        export_format = request.GET.get('format', 'jsonl')
+        if export_format not in export.FORMATS:
+            return HttpResponseBadRequest('Неизвестный формат')
+        try:
+            since_id = int(request.GET.get('since', 0))
+        except ValueError:
+            return HttpResponseBadRequest('since должен быть числом')
+
+        bounds = export.export_bounds(since_id)
+        since_id, until_id = bounds or (since_id, since_id)
+        response = StreamingHttpResponse(
+            export.iter_gzip(export.iter_lines(export.iter_rows(since_id, until_id), export_format)),
+            content_type='application/gzip'
+        )
+        response['Content-Disposition'] = f'attachment; filename="history-{since_id}-{until_id}.{export_format}.gz"'
+        # Отметка для следующей выгрузки
+        response['X-Export-Last-Id'] = str(until_id)
+        return response
+
+@admin.register(ActionRollup)
+class ActionRollupAdmin(admin.ModelAdmin):
+    """Страница аналитики по готовым часовым сводкам (manage.py rollup_actions)"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Аналитика действий',
+            'categories': analytics.survival_by_category(),
+            'hours': analytics.actions_per_hour(),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/game/analytics.html', context)
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Снимки ProfilingMiddleware: только просмотр, удаление и скачивание профиля"""
+    list_display = ['captured_at', 'method', 'path', 'view_name', 'status', 'duration_ms', 'query_count',
+                    'reason', 'download_link']
+    list_filter = ['reason', 'view_name']
+    exclude = ['profile']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('profile')
+
+    def get_urls(self):
+        return [
+            path('<int:profile_id>/download/', self.admin_site.admin_view(self.download_view),
+                 name='game_requestprofile_download'),
+        ] + super().get_urls()
+
+    @admin.display(description='Профиль')
+    def download_link(self, obj):
+        if not obj.stats:
+            return '-'
+        return format_html('<a href="{}">.prof</a>', reverse('admin:game_requestprofile_download', args=[obj.id]))
+
+    def download_view(self, request, profile_id):
+        """Профиль в формате pstats: python -m pstats или snakeviz"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        profile = get_object_or_404(RequestProfile.objects.exclude(profile=None), id=profile_id)
+        response = HttpResponse(bytes(profile.profile), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="{profile.view_name}-{profile.id}.prof"'
+        return response
@@ -0,0 +1,92 @@
+from datetime import timedelta
+from django.db.models import Count, Min, Max, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from .models import ActionRollup, PlayerAction, Situation
+
+# Вердикт может прийти позже создания действия - последние часы пересчитываются заново
+RECOMPUTE_HOURS = 2
+# Действия агрегируются окнами, чтобы первый запуск не держал БД одним большим запросом
+WINDOW = timedelta(days=1)
+
+
+def update_rollups(now=None):
+    """Пересчитывает часовые сводки действий начиная с последней записанной.
+
+    Возвращает число обновленных строк сводки.
+    """
+    now = now or timezone.now()
+    last_hour = ActionRollup.objects.aggregate(last=Max('hour'))['last']
+    if last_hour is not None:
+        start = last_hour - timedelta(hours=RECOMPUTE_HOURS - 1)
+    else:
+        start = PlayerAction.objects.aggregate(first=Min('created_at'))['first']
+        if start is None:
+            return 0
+        start = start.replace(minute=0, second=0, microsecond=0)
+
+    updated = 0
+    while start <= now:
+        end = start + WINDOW
+        rows = (
+            PlayerAction.objects
+            .filter(created_at__gte=start, created_at__lt=end, is_pending=False)
+            .annotate(hour=TruncHour('created_at'))
+            .values('hour', 'situation__category')
+            .annotate(actions=Count('id'), survived_count=Count('id', filter=Q(survived=True)))
+            .order_by()
+        )
+        rollups = [
+            ActionRollup(hour=row['hour'], category=row['situation__category'] or '',
+                         actions=row['actions'], survived=row['survived_count'])
+            for row in rows
+        ]
+        if rollups:
+            ActionRollup.objects.bulk_create(
+                rollups,
+                update_conflicts=True,
+                unique_fields=['hour', 'category'],
+                update_fields=['actions', 'survived']
+            )
+            updated += len(rollups)
+        start = end
+    return updated
+
+
+def survival_by_category(days=7):
+    """Доля выживаний по категориям за последние дни: список словарей category, label, actions, survived, rate"""
+    labels = dict(Situation.CATEGORY_CHOICES)
+    since = timezone.now() - timedelta(days=days)
+    rows = (
+        ActionRollup.objects
+        .filter(hour__gte=since)
+        .values('category')
+        .annotate(total_actions=Sum('actions'), total_survived=Sum('survived'))
+        .order_by('category')
+    )
+    return [
+        {
+            'category': row['category'],
+            'label': labels.get(row['category'], 'Без ситуации'),
+            'actions': row['total_actions'],
+            'survived': row['total_survived'],
+            'rate': row['total_survived'] / row['total_actions'] if row['total_actions'] else 0,
+        }
+        for row in rows
+    ]
+
+
+def actions_per_hour(hours=48):
+    """Число действий и выживаний по часам за последние часы"""
+    since = timezone.now() - timedelta(hours=hours)
+    rows = (
+        ActionRollup.objects
+        .filter(hour__gte=since)
+        .values('hour')
+        .annotate(total_actions=Sum('actions'), total_survived=Sum('survived'))
+        .order_by('hour')
+    )
+    return [
+        {'hour': row['hour'], 'actions': row['total_actions'], 'survived': row['total_survived']}
+        for row in rows
+    ]
@@ -0,0 +1,157 @@
+import json
+from functools import wraps
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from .models import GameSession, PlayerAction
+from . import evaluation
+from . import ratelimit
+from . import sessions
+
+# JSON API игрового цикла: один запрос на шаг, без редиректов.
+# Сессия в ответе: {'id', 'lives', 'score', 'active'}, ситуация: {'id', 'text', 'category'},
+# вердикт: {'pending', 'survived', 'feedback'}. Тело POST-запросов - только application/json.
+
+
+def json_post(view):
+    """POST только с телом application/json.
+
+    Вместо проверки CSRF: браузер не отправит такой запрос на чужой сайт
+    без предварительного CORS-запроса, а форма может отправить только
+    form-urlencoded, multipart или text/plain.
+    """
+    @csrf_exempt
+    @require_POST
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.content_type != 'application/json':
+            return _error('Ожидается Content-Type: application/json', 415)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _payload(request):
+    """Параметры из JSON-тела"""
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _get_session(session_id):
+    return get_object_or_404(GameSession.objects.select_related('situation'), id=session_id)
+
+
+def _session_data(game_session):
+    return {
+        'id': game_session.id,
+        'lives': game_session.lives,
+        'score': game_session.score,
+        'active': game_session.is_active and game_session.lives > 0,
+    }
+
+
+def _situation_data(situation):
+    if situation is None:
+        return None
+    return {'id': situation.id, 'text': situation.text, 'category': situation.category}
+
+
+def _verdict_data(action):
+    if action is None:
+        return None
+    if action.is_pending:
+        return {'pending': True}
+    return {'pending': False, 'survived': action.survived, 'feedback': action.feedback}
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+
+@json_post
+def start(request):
+    """Новая игра: {'player_name'} -> сессия и первая ситуация"""
+    player_name = str(_payload(request).get('player_name', '')).strip()
+    if not player_name:
+        return _error('Введите имя игрока', 400)
+    
+    game_session = sessions.start_session(player_name)
+    return JsonResponse({
+        'session': _session_data(game_session),
+        'situation': _situation_data(game_session.situation),
+    }, status=201)
+
+
+@json_post
+def act(request, session_id):
+    """Ход: {'action'} -> вердикт, новые счет и жизни и сразу следующая ситуация.
+
+    В режимах оценки 'async' и 'stream' ответ 202 без ситуации: клиент опрашивает
+    state до вердикта, а следующую ситуацию запрашивает через next.
+    """
+    game_session = _get_session(session_id)
+    action_text = str(_payload(request).get('action', '')).strip()
+    if not action_text:
+        return _error('Опишите действие', 400)
+    if not (game_session.is_active and game_session.lives > 0):
+        return _error('Игра завершена', 409)
+    if evaluation.pending_action(game_session):
+        return _error('Предыдущее действие еще оценивается', 409)
+    
+    retry_after = ratelimit.check(request, 'submit', game_session.player_id)
+    if retry_after:
+        return ratelimit.too_many_requests(retry_after, json=True)
+    
+    try:
+        action = evaluation.submit(game_session, action_text)
+    except evaluation.ActionPending:
+        return _error('Предыдущее действие еще оценивается', 409)
+    if action.is_pending:
+        return JsonResponse({'session': _session_data(game_session), 'verdict': _verdict_data(action)}, status=202)
+    
+    # submit вернул действие с уже обновленной сессией
+    game_session = action.game_session
+    next_situation = None
+    if game_session.is_active and game_session.lives > 0:
+        next_situation = sessions.advance(game_session).situation
+    
+    return JsonResponse({
+        'session': _session_data(game_session),
+        'verdict': _verdict_data(action),
+        'situation': _situation_data(next_situation),
+    })
+
+
+@json_post
+def next_situation(request, session_id):
+    """Пропуск ситуации -> новая ситуация"""
+    game_session = _get_session(session_id)
+    if not (game_session.is_active and game_session.lives > 0):
+        return _error('Игра завершена', 409)
+    if evaluation.pending_action(game_session):
+        return _error('Предыдущее действие еще оценивается', 409)
+    
+    sessions.advance(game_session)
+    return JsonResponse({
+        'session': _session_data(game_session),
+        'situation': _situation_data(game_session.situation),
+    })
+
+
+@require_GET
+def state(request, session_id):
+    """Текущее состояние: сессия, ситуация и вердикт последнего действия"""
+    game_session = _get_session(session_id)
+    latest_action = PlayerAction.objects.filter(game_session=game_session).order_by('-created_at').first()
+    if latest_action and latest_action.is_pending and not evaluation.resolve_stale(latest_action):
+        latest_action.refresh_from_db()
+        game_session.refresh_from_db()
+    
+    return JsonResponse({
+        'session': _session_data(game_session),
+        'situation': _situation_data(game_session.situation),
+        'verdict': _verdict_data(latest_action),
+    })
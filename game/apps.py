@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class GameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'game'
+
+    def ready(self):
+        from . import checks  # noqa: F401
+        from . import signals  # noqa: F401
+        from .metrics import register_default_gauges
+        register_default_gauges()
@@ -0,0 +1,65 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from .metrics import COUNT_BUCKETS, registry
+
+
+class EvaluationBatcher:
+    """Собирает планы разных игроков в пачки для одного запроса к ИИ.
+
+    Пачка уходит, когда набралось max_size планов или с прихода первого
+    прошло window секунд. send_batch(items) получает список пар
+    (ситуация, план) и возвращает список результатов в том же порядке;
+    None - для плана без вердикта.
+    """
+
+    def __init__(self, send_batch, max_size, window, workers):
+        self.send_batch = send_batch
+        self.max_size = max_size
+        self.window = window
+        self._queue = []
+        self._condition = threading.Condition()
+        self._dispatcher = None
+        # Пачки отправляются параллельно, пока диспетчер собирает следующую
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='evaluation-batch')
+
+    def evaluate(self, situation_text, player_plan, timeout=None):
+        """Результат для одного плана (блокирует до ответа на его пачку)"""
+        future = Future()
+        with self._condition:
+            self._queue.append((time.monotonic(), (situation_text, player_plan), future))
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name='evaluation-batcher', daemon=True)
+                self._dispatcher.start()
+            self._condition.notify()
+        return future.result(timeout)
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                # Окно отсчитывается от прихода самого старого плана
+                deadline = self._queue[0][0] + self.window
+                while len(self._queue) < self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._queue[:self.max_size]
+                del self._queue[:self.max_size]
+            self._executor.submit(self._send, batch)
+
+    def _send(self, batch):
+        registry.observe('llm_batch_size', len(batch), buckets=COUNT_BUCKETS)
+        try:
+            results = self.send_batch([item for _, item, _ in batch])
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        # Результатов меньше, чем планов, - недостающим None (вызывающий перейдет на резервную оценку)
+        results = list(results)[:len(batch)]
+        results += [None] * (len(batch) - len(results))
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
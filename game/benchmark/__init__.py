@@ -0,0 +1,6 @@
+"""Нагрузочное тестирование игры без настоящего API DeepSeek.
+
+fake_llm - локальный OpenAI-совместимый сервер-заглушка,
+runner - сценарии игроков, статистика и сравнение с базовой линией.
+Запуск: python manage.py benchmark
+"""
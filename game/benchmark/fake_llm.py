@@ -0,0 +1,154 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SITUATIONS = [
+    "Вы застряли в лифте небоскреба между 40 и 41 этажом. Трос скрипит, а связь с диспетчером пропала.",
+    "Ваша лодка перевернулась в горной реке. Течение несет вас к водопаду, до берега двадцать метров.",
+    "Вы проснулись в заброшенной шахте. Фонарик почти разряжен, а где-то капает вода.",
+]
+
+
+class LatencyModel:
+    """Распределение задержки ответа заглушки.
+
+    Формат: 'fixed:0.2', 'uniform:0.1,0.5', 'normal:0.3,0.1'
+    или 'lognormal:0.3,0.5' (медиана и sigma).
+    """
+
+    def __init__(self, spec='fixed:0'):
+        kind, _, params = spec.partition(':')
+        self.kind = kind
+        self.params = [float(value) for value in params.split(',') if value]
+        if kind not in ('fixed', 'uniform', 'normal', 'lognormal'):
+            raise ValueError(f'Неизвестное распределение задержки: {spec}')
+
+    def sample(self, rng):
+        if self.kind == 'fixed':
+            return self.params[0] if self.params else 0.0
+        if self.kind == 'uniform':
+            return rng.uniform(*self.params)
+        if self.kind == 'normal':
+            return max(0.0, rng.gauss(*self.params))
+        median, sigma = self.params
+        return median * rng.lognormvariate(0, sigma)
+
+
+def _verdict(survived):
+    return {
+        'survived': survived,
+        'story_continuation': 'Вы действуете быстро и решительно.' if survived else 'План проваливается.',
+        'analysis': 'Ответ сервера-заглушки для нагрузочного теста.'
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят разными пакетами - без этого каждый ответ ждет отложенного ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server.fake
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        delay, failed = server.next_response()
+        time.sleep(delay)
+
+        if failed:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        messages = body['messages']
+        prompt = messages[-1]['content']
+        if len(messages) > 2 and 'JSON-массив' in messages[-2]['content']:
+            # Пакетная оценка: случаи - JSON-массив в последнем сообщении, по вердикту на каждый id
+            cases = json.loads(prompt)
+            content = json.dumps([dict(_verdict(server.survives()), id=case['id']) for case in cases],
+                                 ensure_ascii=False)
+        elif 'JSON' in prompt:
+            content = json.dumps(_verdict(server.survives()), ensure_ascii=False)
+        else:
+            content = random.choice(SITUATIONS)
+
+        if body.get('stream'):
+            self._send_stream(content)
+        else:
+            self._send_json({'choices': [{'message': {'content': content}}]})
+
+    def _send_json(self, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, content):
+        """Ответ кусками в формате Server-Sent Events, как у stream=True"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for start in range(0, len(content), 8):
+            chunk = {'choices': [{'delta': {'content': content[start:start + 8]}}]}
+            self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.wfile.flush()
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.close_connection = True
+
+
+class FakeLLMServer:
+    """OpenAI-совместимая заглушка API с настраиваемой задержкой и долей ошибок"""
+
+    def __init__(self, latency='fixed:0', error_rate=0.0, survive_rate=0.5, seed=None):
+        self.latency = LatencyModel(latency)
+        self.error_rate = error_rate
+        self.survive_rate = survive_rate
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_port}/v1/chat/completions'
+
+    def next_response(self):
+        """(задержка, ошибка ли) для очередного запроса"""
+        with self._lock:
+            self.requests += 1
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return self.latency.sample(self._rng), failed
+
+    def survives(self):
+        with self._lock:
+            return self._rng.random() < self.survive_rate
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
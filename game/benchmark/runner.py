@@ -0,0 +1,179 @@
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection, connections
+from django.test import Client
+from django.urls import resolve
+
+PLANS = [
+    'Осмотрюсь, найду укрытие и буду ждать помощи, экономя воду и силы.',
+    'Позвоню в службу спасения, опишу место и буду подавать сигналы фонариком.',
+    'Соберу все полезные предметы, разведу огонь и построю укрытие до утра.',
+    'Побегу куда глаза глядят.',
+    'Постараюсь сохранять спокойствие и медленно выбраться тем же путем, что пришел.',
+    'Ничего не буду делать.',
+]
+
+# Конечные точки в отчете - по имени маршрута
+ENDPOINTS = ['start_game', 'game_page', 'submit_action', 'result_page', 'action_status',
+             'next_situation', 'leaderboard']
+
+
+def percentile(values, q):
+    """Процентиль q (0-100) с линейной интерполяцией"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class _QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Stats:
+    """Задержки и число SQL-запросов по конечным точкам (общие для всех потоков)"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, seconds, queries, failed):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((seconds, queries))
+            if failed:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, duration):
+        endpoints = {}
+        total = 0
+        for endpoint, samples in self.samples.items():
+            latencies = [seconds for seconds, _ in samples]
+            queries = [count for _, count in samples]
+            total += len(samples)
+            endpoints[endpoint] = {
+                'count': len(samples),
+                'errors': self.errors.get(endpoint, 0),
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'queries_avg': sum(queries) / len(queries),
+                'queries_max': max(queries),
+            }
+        return {
+            'requests': total,
+            'duration': duration,
+            'rps': total / duration if duration else 0.0,
+            'endpoints': endpoints,
+        }
+
+
+class Journey:
+    """Сценарий одного игрока: старт -> (ход -> результат -> следующая ситуация) x rounds -> лидеры"""
+
+    def __init__(self, stats, name, rounds, rng, poll_interval=0.05, poll_timeout=30):
+        self.stats = stats
+        self.name = name
+        self.rounds = rounds
+        self.rng = rng
+        self.poll_interval = poll_interval
+        self.poll_timeout = poll_timeout
+        self.client = Client()
+
+    def request(self, endpoint, method, path, data=None):
+        counter = _QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = getattr(self.client, method)(path, data or {})
+        if hasattr(response, 'streaming_content'):
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+        self.stats.add(endpoint, elapsed, counter.count, response.status_code >= 400)
+        return response
+
+    def redirect_target(self, response):
+        """Имя маршрута, на который ведет редирект (или None)"""
+        if response.status_code != 302:
+            return None
+        return resolve(response['Location']).url_name
+
+    def play(self):
+        response = self.request('start_game', 'post', '/start/', {'player_name': self.name})
+        if self.redirect_target(response) != 'game_page':
+            return
+        session_id = resolve(response['Location']).kwargs['session_id']
+
+        for _ in range(self.rounds):
+            self.request('game_page', 'get', f'/game/{session_id}/')
+            self.request('submit_action', 'post', f'/game/{session_id}/submit/',
+                         {'action_text': self.rng.choice(PLANS)})
+            self.request('result_page', 'get', f'/game/{session_id}/result/')
+            self.wait_for_verdict(session_id)
+            response = self.request('next_situation', 'get', f'/game/{session_id}/next/')
+            if self.redirect_target(response) != 'game_page':
+                # Жизни кончились - игра окончена
+                break
+
+        self.request('leaderboard', 'get', '/leaderboard/')
+
+    def wait_for_verdict(self, session_id):
+        """В фоновом режиме оценки опрашиваем статус, как страница ожидания"""
+        deadline = time.monotonic() + self.poll_timeout
+        while time.monotonic() < deadline:
+            status = self.request('action_status', 'get', f'/game/{session_id}/status/')
+            if not status.json()['pending']:
+                return
+            time.sleep(self.poll_interval)
+
+
+def run(players=20, rounds=3, concurrency=4, seed=None):
+    """Прогоняет players сценариев в concurrency потоков, возвращает сводку"""
+    stats = Stats()
+    rng = random.Random(seed)
+    journeys = [Journey(stats, f'Bench Player {number}', rounds, random.Random(rng.random()))
+                for number in range(players)]
+
+    def play(journey):
+        try:
+            journey.play()
+        finally:
+            connections.close_all()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='benchmark') as executor:
+        # list() - чтобы исключения сценариев не потерялись
+        list(executor.map(play, journeys))
+    return stats.summary(time.perf_counter() - started)
+
+
+def compare(result, baseline, tolerance=0.25, min_slowdown=0.005):
+    """Регрессии относительно базовой линии - список описаний (пустой, если их нет).
+
+    Регрессия - p95 хуже более чем на tolerance (и больше чем на min_slowdown сек),
+    больше SQL-запросов на запрос или RPS ниже более чем на tolerance.
+    """
+    regressions = []
+    if result['rps'] < baseline['rps'] * (1 - tolerance):
+        regressions.append(f"RPS: {result['rps']:.1f} < {baseline['rps']:.1f}")
+
+    for endpoint, base in baseline['endpoints'].items():
+        current = result['endpoints'].get(endpoint)
+        if current is None:
+            continue
+        limit = max(base['p95'] * (1 + tolerance), base['p95'] + min_slowdown)
+        if current['p95'] > limit:
+            regressions.append(f"{endpoint}: p95 {current['p95'] * 1000:.1f} мс > {base['p95'] * 1000:.1f} мс")
+        if current['queries_max'] > base['queries_max']:
+            regressions.append(f"{endpoint}: SQL-запросов {current['queries_max']} > {base['queries_max']}")
+    return regressions
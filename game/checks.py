@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register(deploy=True)
+def shared_cache_check(app_configs, **kwargs):
+    """Без общего кэша сбросы версий страниц и лимиты работают только внутри одного процесса"""
+    backend = settings.CACHES['default']['BACKEND']
+    if not backend.endswith('LocMemCache'):
+        return []
+    return [Warning(
+        'Кэш по умолчанию хранится в памяти процесса',
+        hint='При нескольких воркерах задайте REDIS_URL: иначе версии страниц, таблиц лидеров '
+             'и лимиты частоты у каждого воркера свои',
+        id='game.W001',
+    )]
@@ -0,0 +1,39 @@
+import zlib
+
+
+class SeenSet:
+    """Битовая карта id ситуаций, уже показанных в сессии.
+
+    В БД хранится сжатой zlib: бит на каждый id до максимального показанного,
+    поэтому даже при десятках тысяч ситуаций строка занимает единицы килобайт,
+    а в начале игры - десятки байт. Новые ситуации в карте не отмечены и
+    попадают в колоду сами, без ее перестройки.
+    """
+
+    def __init__(self, ids=()):
+        self._bits = bytearray()
+        for situation_id in ids:
+            self.add(situation_id)
+
+    @classmethod
+    def from_bytes(cls, data):
+        seen = cls()
+        if data:
+            seen._bits = bytearray(zlib.decompress(bytes(data)))
+        return seen
+
+    def to_bytes(self):
+        return zlib.compress(bytes(self._bits))
+
+    def __contains__(self, situation_id):
+        byte = situation_id >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << (situation_id & 7)))
+
+    def __len__(self):
+        return int.from_bytes(self._bits, 'little').bit_count()
+
+    def add(self, situation_id):
+        byte = situation_id >> 3
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(byte + 1 - len(self._bits)))
+        self._bits[byte] |= 1 << (situation_id & 7)
@@ -0,0 +1,224 @@
+import re
+import threading
+import time
+import zlib
+from array import array
+from django.conf import settings
+
+# Подпись MinHash: NUM_HASHES значений, LSH - BANDS полос по ROWS значений.
+# Кандидатами становятся тексты, совпавшие хотя бы в одной полосе:
+# при сходстве 0.5 это ~65%, при 0.7 - ~99%; кандидаты проверяются по оценке сходства
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+SHINGLE_SIZE = 5
+
+_MASK = (1 << 32) - 1
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def shingles(text):
+    """Множество хэшей символьных k-грамм нормализованного текста.
+
+    Символьные, а не словесные k-граммы: перефразировки на русском часто
+    отличаются окончаниями, и по словам совпадений было бы мало.
+    """
+    normalized = ' '.join(_NON_WORD_RE.sub(' ', text.lower()).split())
+    if len(normalized) <= SHINGLE_SIZE:
+        return {zlib.crc32(normalized.encode())}
+    encoded = normalized.encode()
+    return {zlib.crc32(encoded[start:start + SHINGLE_SIZE]) for start in range(len(encoded) - SHINGLE_SIZE + 1)}
+
+
+def signature(text):
+    """Подпись MinHash одной перестановкой: хэш k-граммы выбирает корзину, в корзине - минимум.
+
+    Один хэш на k-грамму вместо NUM_HASHES - подпись считается за доли миллисекунды.
+    Пустые корзины заполняются из соседних (уплотнение), чтобы подписи оставались сравнимы.
+    """
+    bins = [_MASK] * NUM_HASHES
+    for shingle in shingles(text):
+        # Перемешиваем биты crc32, чтобы номер корзины и значение были независимы
+        mixed = (shingle * 0x9E3779B1) & _MASK
+        mixed ^= mixed >> 16
+        index = mixed % NUM_HASHES
+        value = (mixed * 0x85EBCA6B) & _MASK
+        if value < bins[index]:
+            bins[index] = value
+    for index in range(NUM_HASHES):
+        if bins[index] == _MASK:
+            for offset in range(1, NUM_HASHES):
+                neighbour = bins[(index + offset) % NUM_HASHES]
+                if neighbour != _MASK:
+                    bins[index] = (neighbour + offset) & _MASK
+                    break
+    return array('I', bins)
+
+
+def to_bytes(sig):
+    return sig.tobytes()
+
+
+def from_bytes(data):
+    sig = array('I')
+    sig.frombytes(bytes(data))
+    return sig
+
+
+def similarity(first, second):
+    """Оценка сходства Жаккара по двум подписям"""
+    return sum(a == b for a, b in zip(first, second)) / NUM_HASHES
+
+
+def band_keys(sig):
+    return [hash((band, tuple(sig[band * ROWS:(band + 1) * ROWS]))) for band in range(BANDS)]
+
+
+def _add(signatures, buckets, situation_id, sig):
+    signatures[situation_id] = sig
+    for key in band_keys(sig):
+        buckets.setdefault(key, set()).add(situation_id)
+
+
+def _remove(signatures, buckets, situation_id):
+    sig = signatures.pop(situation_id, None)
+    if sig is None:
+        return
+    for key in band_keys(sig):
+        bucket = buckets.get(key)
+        if bucket:
+            bucket.discard(situation_id)
+            if not bucket:
+                del buckets[key]
+
+
+class NearDuplicateIndex:
+    """LSH-индекс подписей ситуаций в памяти процесса.
+
+    Строится одним запросом по полю Situation.minhash, дополняется сигналами
+    и перечитывается раз в SITUATION_INDEX_TTL, как индекс случайного выбора:
+    новый индекс строится без блокировки, поиск тем временем идет по старому.
+    """
+
+    def __init__(self, load=True):
+        # load=False - временный индекс без чтения из БД (дубли внутри одной пачки)
+        self._load = load
+        self._signatures = None if load else {}
+        self._buckets = {}
+        self._loaded_at = 0
+        self._generation = 0
+        # Изменения, пришедшие во время перестроения, - повторяются на новом индексе
+        self._changes = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _is_fresh(self):
+        if not self._load:
+            return True
+        return self._signatures is not None and time.monotonic() - self._loaded_at < settings.SITUATION_INDEX_TTL
+
+    def _ensure_loaded(self):
+        from .models import Situation
+        if self._is_fresh():
+            return
+        # Перестраивает один поток; остальные ждут, только если индекса еще нет
+        if not self._refresh_lock.acquire(blocking=self._signatures is None):
+            return
+        try:
+            if self._is_fresh():
+                return
+            with self._lock:
+                generation = self._generation
+                self._changes = []
+            signatures = {}
+            buckets = {}
+            rows = Situation.objects.filter(minhash__isnull=False).values_list('id', 'minhash')
+            for situation_id, data in rows.iterator():
+                _add(signatures, buckets, situation_id, from_bytes(data))
+            with self._lock:
+                for change, args in self._changes:
+                    change(signatures, buckets, *args)
+                self._signatures = signatures
+                self._buckets = buckets
+                # Сброшенный во время чтения индекс мог не увидеть новые строки - перечитаем еще раз
+                self._loaded_at = time.monotonic() if generation == self._generation else 0
+        finally:
+            with self._lock:
+                self._changes = None
+            self._refresh_lock.release()
+
+    def _change(self, change, *args):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((change, args))
+            if self._signatures is not None:
+                change(self._signatures, self._buckets, *args)
+
+    def add(self, situation_id, sig):
+        self._change(_add, situation_id, sig)
+
+    def remove(self, situation_id):
+        self._change(_remove, situation_id)
+
+    def find(self, sig, threshold=None, exclude_id=None):
+        """Самая похожая ситуация: (id, сходство) или None, если сходство ниже порога"""
+        if threshold is None:
+            threshold = settings.SITUATION_DUPLICATE_THRESHOLD
+        best = None
+        self._ensure_loaded()
+        with self._lock:
+            if self._signatures is None:
+                return None
+            candidates = set()
+            for key in band_keys(sig):
+                candidates.update(self._buckets.get(key, ()))
+            candidates.discard(exclude_id)
+            for candidate in candidates:
+                score = similarity(sig, self._signatures[candidate])
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (candidate, score)
+        return best
+
+    def invalidate(self):
+        """Сбрасывает индекс - он будет перечитан при следующем поиске"""
+        with self._lock:
+            self._generation += 1
+            self._loaded_at = 0
+
+
+_index = NearDuplicateIndex()
+
+
+def get_index():
+    """Общий для процесса индекс почти-дублей"""
+    return _index
+
+
+def find_duplicate(text):
+    """id уже существующей почти такой же ситуации или None"""
+    match = _index.find(signature(text))
+    return match[0] if match else None
+
+
+def select_new(texts, threshold=None):
+    """Тексты, у которых нет почти-дублей среди ситуаций и друг среди друга.
+
+    Возвращает список пар (текст, подпись) в исходном порядке.
+    """
+    batch = NearDuplicateIndex(load=False)
+    selected = []
+    for text in texts:
+        sig = signature(text)
+        if _index.find(sig, threshold) or batch.find(sig, threshold):
+            continue
+        batch.add(len(selected), sig)
+        selected.append((text, sig))
+    return selected
+
+
+def index_inserted(signatures_by_hash):
+    """Добавляет в индекс ситуации, вставленные bulk_create ({text_hash: подпись})"""
+    from .models import Situation
+    rows = Situation.objects.filter(text_hash__in=list(signatures_by_hash)).values_list('text_hash', 'id')
+    for text_hash, situation_id in rows:
+        _index.add(situation_id, signatures_by_hash[text_hash])
@@ -0,0 +1,223 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import GameSession, PlayerAction
+from .api_client import get_client
+from .leaderboard import record_score
+from . import write_queue
+
+logger = logging.getLogger(__name__)
+
+
+class ActionPending(Exception):
+    """У сессии уже есть действие, ждущее вердикта"""
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Общий для процесса пул потоков для фоновой оценки"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.EVALUATION_WORKERS,
+                thread_name_prefix='evaluation'
+            )
+    return _executor
+
+
+def submit(game_session, action_text):
+    """Принимает действие игрока и оценивает его сразу или в фоне.
+
+    В режиме 'async' действие сохраняется как ожидающее, а запрос к ИИ
+    выполняется в пуле потоков - воркер сразу возвращается к обслуживанию страниц.
+    В режиме 'stream' ожидающее действие оценивает SSE-поток страницы результата.
+    """
+    situation = game_session.situation
+
+    if settings.EVALUATION_MODE in ('async', 'stream'):
+        def create():
+            # Одно ожидающее действие на сессию гарантирует уникальный индекс:
+            # два одновременных хода не пройдут оба
+            try:
+                with transaction.atomic():
+                    return PlayerAction.objects.create(
+                        game_session=game_session,
+                        situation=situation,
+                        action_text=action_text,
+                        feedback='',
+                        is_pending=True
+                    )
+            except IntegrityError:
+                raise ActionPending
+
+        action = write_queue.run(create)
+        if settings.EVALUATION_MODE == 'async':
+            start_background(action)
+        return action
+
+    verdict = get_client().evaluate_survival_plan(situation.text, action_text, situation.id)
+    survived, feedback = verdict
+
+    def write():
+        action = PlayerAction.objects.create(
+            game_session=game_session,
+            situation=situation,
+            action_text=action_text,
+            survived=survived,
+            feedback=feedback,
+            verdict_source=verdict_source(verdict)
+        )
+        # Обновленная сессия - чтобы вызывающему не перечитывать счет и жизни
+        action.game_session = _apply_to_session(game_session.id, survived, situation)
+        return action
+
+    return write_queue.run(write)
+
+
+def verdict_source(verdict):
+    """Источник вердикта для PlayerAction.verdict_source"""
+    return getattr(verdict, 'source', '')
+
+
+def complete(action, survived, feedback, source=''):
+    """Записывает вердикт для ожидающего действия и обновляет сессию"""
+    def write():
+        updated = PlayerAction.objects.filter(id=action.id, is_pending=True).update(
+            survived=survived,
+            feedback=feedback,
+            verdict_source=source,
+            is_pending=False
+        )
+        # Действие уже кто-то оценил - сессию второй раз не трогаем
+        if not updated:
+            return None
+        return _apply_to_session(action.game_session_id, survived, action.situation)
+
+    return write_queue.run(write)
+
+
+def claim(action):
+    """Берет аренду на оценку действия: True, если оценивать должен вызывающий.
+
+    Аренда - отметка evaluation_started_at; чужая аренда старше EVALUATION_LEASE
+    считается брошенной (поток или процесс умер, браузер закрыл SSE-поток).
+    """
+    now = timezone.now()
+    claimed = PlayerAction.objects.filter(
+        Q(evaluation_started_at__isnull=True) | Q(evaluation_started_at__lt=now - timedelta(seconds=settings.EVALUATION_LEASE)),
+        id=action.id,
+        is_pending=True
+    ).update(evaluation_started_at=now)
+    return bool(claimed)
+
+
+def release(action):
+    """Отдает аренду, не вынеся вердикт, - действие сразу сможет оценить другой"""
+    PlayerAction.objects.filter(id=action.id, is_pending=True).update(evaluation_started_at=None)
+
+
+def start_background(action):
+    """Оценка в пуле потоков, если удалось взять аренду.
+
+    Запускается после фиксации транзакции, иначе поток может не увидеть запись.
+    """
+    def start():
+        if claim(action):
+            get_executor().submit(_evaluate_in_background, action.id)
+
+    transaction.on_commit(start)
+
+
+def pending_action(game_session):
+    """Ожидающее вердикта действие сессии или None (зависшее - см. resolve_stale)"""
+    action = (
+        PlayerAction.objects
+        .select_related('situation')
+        .filter(game_session=game_session, is_pending=True)
+        .order_by('-created_at')
+        .first()
+    )
+    if action is not None and resolve_stale(action):
+        return action
+    return None
+
+
+def resolve_stale(action):
+    """Не дает ожидающему действию зависнуть. Возвращает True, если вердикта все еще нет.
+
+    Действие без аренды дольше EVALUATION_START_GRACE (SSE-поток так и не
+    пришел или оборвался, процесс перезапустился) уходит на оценку в фон,
+    а старше EVALUATION_PENDING_TIMEOUT получает резервный вердикт.
+    """
+    age = (timezone.now() - action.created_at).total_seconds()
+    if age > settings.EVALUATION_PENDING_TIMEOUT:
+        logger.warning("Action %s pending for %.0f s, using fallback verdict", action.id, age)
+        _complete_with_fallback(action)
+        return False
+    if age > settings.EVALUATION_START_GRACE:
+        start_background(action)
+    return True
+
+
+def _complete_with_fallback(action):
+    situation_text = action.situation.text if action.situation else ''
+    verdict = get_client()._get_strict_fallback_evaluation(situation_text, action.action_text)
+    survived, feedback = verdict
+    complete(action, survived, feedback, verdict_source(verdict))
+
+
+def _apply_to_session(session_id, survived, situation=None):
+    """Начисляет очко или снимает жизнь, обновляет таблицу лидеров"""
+    game_session = GameSession.objects.select_for_update().get(id=session_id)
+
+    if survived:
+        game_session.score += 1
+    else:
+        game_session.lives -= 1
+
+    if game_session.lives <= 0:
+        game_session.is_active = False
+
+    game_session.save()
+
+    if survived:
+        record_score(game_session, situation.category if situation else None)
+    return game_session
+
+
+def _evaluate_in_background(action_id):
+    """Задача пула: оценка одного ожидающего действия"""
+    action = None
+    try:
+        action = PlayerAction.objects.select_related('situation').get(id=action_id, is_pending=True)
+        situation_text = action.situation.text if action.situation else ''
+
+        verdict = get_client().evaluate_survival_plan(
+            situation_text,
+            action.action_text,
+            action.situation_id
+        )
+        survived, feedback = verdict
+        complete(action, survived, feedback, verdict_source(verdict))
+    except PlayerAction.DoesNotExist:
+        pass
+    except Exception as e:
+        logger.exception("Background Evaluation Error: %s", e)
+        # Без вердикта сессия осталась бы заблокированной
+        if action is not None:
+            try:
+                _complete_with_fallback(action)
+            except Exception:
+                logger.exception("Fallback verdict for action %s failed", action_id)
+    finally:
+        # Поток живет долго - не держим соединения с БД между задачами
+        connections.close_all()
@@ -0,0 +1,148 @@
+import csv
+import gzip
+import io
+import logging
+import zlib
+from datetime import timedelta
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Min
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ['jsonl', 'csv']
+
+# Колонки выгрузки: (имя в файле, поле для values_list)
+COLUMNS = [
+    ('action_id', 'id'),
+    ('created_at', 'created_at'),
+    ('action_text', 'action_text'),
+    ('survived', 'survived'),
+    ('feedback', 'feedback'),
+    ('verdict_source', 'verdict_source'),
+    ('session_id', 'game_session_id'),
+    ('player', 'game_session__player__name'),
+    ('session_score', 'game_session__score'),
+    ('session_lives', 'game_session__lives'),
+    ('situation_id', 'situation_id'),
+    ('situation_category', 'situation__category'),
+    ('situation_text', 'situation__text'),
+]
+HEADER = [name for name, _ in COLUMNS]
+
+
+def export_bounds(since_id=0):
+    """Диапазон id для выгрузки после since_id: (since_id, последний id) или None, если выгружать нечего.
+
+    Действия, ждущие вердикта, в выгрузку не попадают, поэтому диапазон
+    заканчивается перед первым из них - следующая выгрузка с этой отметки
+    заберет его уже с вердиктом. Действия, ждущие дольше
+    EVALUATION_PENDING_TIMEOUT, считаются зависшими и диапазон не
+    останавливают: они пропускаются с предупреждением в журнале.
+    """
+    from .models import PlayerAction
+    newer = PlayerAction.objects.filter(id__gt=since_id)
+    last_id = newer.aggregate(last=Max('id'))['last']
+    if last_id is None:
+        return None
+    cutoff = timezone.now() - timedelta(seconds=settings.EVALUATION_PENDING_TIMEOUT)
+    pending = newer.filter(is_pending=True)
+    first_pending = pending.filter(created_at__gte=cutoff).aggregate(first=Min('id'))['first']
+    if first_pending is not None:
+        last_id = first_pending - 1
+    stuck = list(pending.filter(created_at__lt=cutoff, id__lte=last_id).values_list('id', flat=True)[:10])
+    if stuck:
+        logger.warning('Выгрузка пропускает зависшие действия без вердикта: %s', stuck)
+    return (since_id, last_id) if last_id > since_id else None
+
+
+def partitions(since_id, until_id, count):
+    """Делит диапазон id (since_id, until_id] на count частей для параллельной выгрузки"""
+    step = max(1, -(-(until_id - since_id) // count))
+    return [(start, min(start + step, until_id)) for start in range(since_id, until_id, step)]
+
+
+def iter_rows(since_id, until_id, chunk_size=2000):
+    """Строки действий с id в (since_id, until_id] по возрастанию id.
+
+    Читает пачками по первичному ключу (WHERE id > последний), а не OFFSET
+    и не всем запросом сразу - память не зависит от размера таблицы.
+    """
+    from .models import PlayerAction
+    fields = [field for _, field in COLUMNS]
+    last_id = since_id
+    while True:
+        chunk = list(
+            PlayerAction.objects
+            .filter(id__gt=last_id, id__lte=until_id, is_pending=False)
+            .order_by('id')
+            .values_list(*fields)[:chunk_size]
+        )
+        if not chunk:
+            return
+        yield from chunk
+        last_id = chunk[-1][0]
+
+
+def iter_lines(rows, export_format):
+    """Строки файла выгрузки (для csv первой идет заголовок)"""
+    if export_format == 'jsonl':
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+        for row in rows:
+            yield encoder.encode(dict(zip(HEADER, row))) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_gzip(lines, flush_bytes=64 * 1024):
+    """Сжимает поток строк в gzip кусками - для потокового HTTP-ответа"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    pending = []
+    size = 0
+    for line in lines:
+        data = line.encode()
+        pending.append(data)
+        size += len(data)
+        if size >= flush_bytes:
+            chunk = compressor.compress(b''.join(pending))
+            pending = []
+            size = 0
+            if chunk:
+                yield chunk
+    yield compressor.compress(b''.join(pending)) + compressor.flush()
+
+
+def write_file(path, since_id, until_id, export_format, chunk_size=2000):
+    """Выгружает диапазон id в файл (.gz - со сжатием). Возвращает число строк"""
+    count = 0
+    opener = gzip.open if str(path).endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8', newline='') as stream:
+        for line in iter_lines(iter_rows(since_id, until_id, chunk_size), export_format):
+            stream.write(line)
+            count += 1
+    # Заголовок csv - не строка данных
+    return count - 1 if export_format == 'csv' else count
+
+
+def init_worker():
+    """Инициализация процесса пула выгрузки"""
+    if not apps.ready:
+        django.setup()
+
+
+def export_partition(args):
+    """Выгрузка одной части в процессе пула: (путь, since_id, until_id, формат, размер пачки)"""
+    path, since_id, until_id, export_format, chunk_size = args
+    return path, write_file(path, since_id, until_id, export_format, chunk_size)
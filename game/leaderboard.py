@@ -0,0 +1,153 @@
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from . import page_cache
+from .models import BestScore, PlayerAction
+
+# period_start для таблицы "за все время"
+ALL_TIME_START = date(2000, 1, 1)
+
+PERIODS = [period for period, _ in BestScore.PERIOD_CHOICES]
+
+
+def period_start(period, day=None):
+    """Начало периода таблицы лидеров, в который попадает день"""
+    if period == 'all':
+        return ALL_TIME_START
+    day = day or timezone.localdate()
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def board_key(period, category='', day=None):
+    return f'{period}:{period_start(period, day).isoformat()}:{category}'
+
+
+# Версии и пороги таблиц хранятся в основном кэше Django: общими для воркеров
+# они становятся с Redis (REDIS_URL), без него сбросы не доходят до других процессов
+
+
+def get_version(key):
+    """Версия таблицы - меняется, только когда меняется ее первая страница"""
+    return page_cache.get_version(f'leaderboard:{key}')
+
+
+def _bump_version(key):
+    page_cache.bump_version(f'leaderboard:{key}')
+
+
+def record_score(game_session, category=None):
+    """Обновляет таблицы лидеров после изменения счета сессии.
+
+    Общий зачет считается по счету сессии, зачет категории - по числу
+    выживаний в ситуациях этой категории за сессию. В обычном случае
+    (результат не улучшился) это один запрос.
+    """
+    today = timezone.localdate()
+    scores = {'': game_session.score}
+    if category:
+        scores[category] = PlayerAction.objects.filter(
+            game_session=game_session,
+            survived=True,
+            situation__category=category
+        ).count()
+
+    boards = {
+        (period, period_start(period, today), board_category): score
+        for period in PERIODS
+        for board_category, score in scores.items()
+    }
+    current = {
+        (entry.period, entry.period_start, entry.category): entry
+        for entry in BestScore.objects.filter(
+            player_id=game_session.player_id,
+            period__in=PERIODS,
+            period_start__in={start for _, start, _ in boards},
+            category__in=list(scores)
+        )
+    }
+
+    changed = []
+    missing = []
+    improved = {}
+    for board, score in boards.items():
+        entry = current.get(board)
+        if entry is None:
+            missing.append(board)
+        elif entry.score < score:
+            improved.setdefault(score, []).append((entry.id, board))
+
+    # Один UPDATE на каждое значение счета; условие защищает от параллельного понижения
+    for score, entries in improved.items():
+        updated = BestScore.objects.filter(
+            id__in=[entry_id for entry_id, _ in entries], score__lt=score
+        ).update(score=score, session=game_session)
+        if updated:
+            changed.extend(board for _, board in entries)
+
+    if missing:
+        BestScore.objects.bulk_create(
+            [
+                BestScore(player_id=game_session.player_id, session=game_session, period=period,
+                          period_start=start, category=board_category, score=boards[(period, start, board_category)])
+                for period, start, board_category in missing
+            ],
+            ignore_conflicts=True
+        )
+        # Пропущенные при конфликте строки создал параллельный запрос: вставленными
+        # считаются только строки этой сессии, остальные обновляются по условию
+        inserted = set(
+            BestScore.objects.filter(
+                player_id=game_session.player_id,
+                session=game_session,
+                period_start__in={start for _, start, _ in missing},
+                category__in={board_category for _, _, board_category in missing}
+            ).values_list('period', 'period_start', 'category')
+        )
+        for board in missing:
+            if board in inserted:
+                changed.append(board)
+                continue
+            period, start, board_category = board
+            if BestScore.objects.filter(
+                player_id=game_session.player_id, period=period, period_start=start,
+                category=board_category, score__lt=boards[board]
+            ).update(score=boards[board], session=game_session):
+                changed.append(board)
+
+    for board in changed:
+        # Сбрасываем кэш, только если результат попадает на первую страницу
+        period, _, board_category = board
+        key = board_key(period, board_category, today)
+        threshold = cache.get(f'leaderboard:threshold:{key}')
+        if threshold is None or boards[board] >= threshold:
+            _bump_version(key)
+
+
+def get_leaders(period='all', category='', page=1):
+    """Страница таблицы лидеров одним запросом по индексу.
+
+    Возвращает (список лучших сессий, есть ли следующая страница).
+    """
+    page_size = settings.LEADERBOARD_PAGE_SIZE
+    offset = (page - 1) * page_size
+    entries = list(
+        BestScore.objects
+        .filter(period=period, period_start=period_start(period), category=category)
+        .select_related('session__player')
+        .order_by('-score', '-session_id')[offset:offset + page_size + 1]
+    )
+    has_next = len(entries) > page_size
+    leaders = []
+    for entry in entries[:page_size]:
+        # Показываем лучший результат, а не текущий счет сессии
+        entry.session.score = entry.score
+        leaders.append(entry.session)
+
+    if page == 1:
+        # Минимальный счет на первой странице: более низкие результаты ее не меняют
+        threshold = leaders[-1].score if len(leaders) == page_size else -1
+        cache.set(f'leaderboard:threshold:{board_key(period, category)}', threshold, None)
+    return leaders, has_next
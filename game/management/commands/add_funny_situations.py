@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from game.models import Situation
+from game.seeding import seed_situations
 
 class Command(BaseCommand):
     help = 'Добавляет смешные ситуации в базу данных'
@@ -21,11 +21,8 @@ class Command(BaseCommand):
             {"text": "Вы просыпаетесь и понимаете, что гравитация работает боком. Все приклеено к стенам, включая кота.", "category": "fantasy"},
         ]
         
-        created_count = 0
-        for situation_data in funny_situations:
-            if not Situation.objects.filter(text=situation_data["text"]).exists():
-                Situation.objects.create(**situation_data)
-                created_count += 1
+        # Дубли отсекаются по хэшу текста, вставка - пачкой в одной транзакции
+        created_count, _ = seed_situations(funny_situations)
         
         self.stdout.write(
             self.style.SUCCESS(f'Успешно добавлено {created_count} смешных ситуаций!')
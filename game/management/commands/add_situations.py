@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from game.models import Situation
+from game.seeding import seed_situations
 
 class Command(BaseCommand):
     help = 'Добавляет тестовые ситуации в базу данных'
@@ -28,12 +28,8 @@ class Command(BaseCommand):
             {"text": "Роботы-убийцы начали охоту на людей. Они взломали все системы слежения и знают, где вы.", "category": "fantasy"},
         ]
         
-        created_count = 0
-        for situation_data in situations:
-            # Проверяем, нет ли уже такой ситуации
-            if not Situation.objects.filter(text=situation_data["text"]).exists():
-                Situation.objects.create(**situation_data)
-                created_count += 1
+        # Дубли отсекаются по хэшу текста, вставка - пачкой в одной транзакции
+        created_count, _ = seed_situations(situations)
         
         self.stdout.write(
             self.style.SUCCESS(f'Успешно добавлено {created_count} новых ситуаций!')
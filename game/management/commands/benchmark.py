@@ -0,0 +1,128 @@
+import json
+import os
+import tempfile
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from game import api_client
+from game.benchmark import fake_llm, runner
+from game.models import Situation
+from game.sampler import get_sampler
+from game.seeding import seed_situations
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест: сценарии игроков против локальной заглушки API во временной базе'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=20, help='Число сценариев игроков')
+        parser.add_argument('--rounds', type=int, default=3, help='Ходов в одном сценарии')
+        parser.add_argument('--concurrency', type=int, default=4, help='Одновременных игроков')
+        parser.add_argument('--situations', type=int, default=50, help='Ситуаций в тестовой базе')
+        parser.add_argument('--llm-latency', default='lognormal:0.05,0.5',
+                            help="Задержка заглушки API: fixed:S, uniform:A,B, normal:M,SD, lognormal:MEDIAN,SIGMA")
+        parser.add_argument('--llm-error-rate', type=float, default=0.0, help='Доля ответов 503')
+        parser.add_argument('--evaluation-mode', choices=['sync', 'async', 'stream'],
+                            help='EVALUATION_MODE на время теста (по умолчанию - из настроек)')
+        parser.add_argument('--batch-size', type=int, help='EVALUATION_BATCH_SIZE на время теста')
+        parser.add_argument('--batch-window', type=float, help='EVALUATION_BATCH_WINDOW на время теста')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--save-baseline', metavar='PATH', help='Сохранить результат как базовую линию')
+        parser.add_argument('--baseline', metavar='PATH', help='Сравнить с базовой линией, регрессия - ошибка')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Допустимое ухудшение (доля)')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Не удалось прочитать базовую линию: {e}')
+
+        result = self.run_benchmark(options)
+        self.print_report(result)
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w', encoding='utf-8') as baseline_file:
+                json.dump(result, baseline_file, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Базовая линия сохранена в {options['save_baseline']}")
+
+        if baseline:
+            regressions = runner.compare(result, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Регрессия производительности:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий относительно базовой линии нет'))
+
+    def run_benchmark(self, options):
+        # Временная файловая база: рабочие данные не трогаем, а потоки
+        # не упираются в блокировки базы SQLite в памяти
+        handle, db_path = tempfile.mkstemp(suffix='.sqlite3', prefix='benchmark-')
+        os.close(handle)
+        connection.settings_dict['TEST']['NAME'] = db_path
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        server = fake_llm.FakeLLMServer(options['llm_latency'], options['llm_error_rate'], seed=options['seed'])
+        overrides = {
+            'DEEPSEEK_API_KEY': 'benchmark',
+            'DEEPSEEK_API_URL': server.start(),
+            'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                   'LOCATION': 'benchmark'}},
+            'EVALUATION_MODE': options['evaluation_mode'] or settings.EVALUATION_MODE,
+            # Все игроки приходят с одного адреса - лимиты частоты отключаем
+            'RATE_LIMITS': {},
+        }
+        if options['batch_size'] is not None:
+            overrides['EVALUATION_BATCH_SIZE'] = options['batch_size']
+        if options['batch_window'] is not None:
+            overrides['EVALUATION_BATCH_WINDOW'] = options['batch_window']
+        try:
+            with override_settings(**overrides):
+                # Клиент и индекс ситуаций пересоздаются под заглушку и тестовую базу
+                api_client._client = None
+                categories = [value for value, _ in Situation.CATEGORY_CHOICES]
+                # Варианты одного текста - почти-дубли, поэтому их фильтр отключен:
+                # иначе в базе осталось бы несколько ситуаций и кэш вердиктов завышал бы результат
+                created, _ = seed_situations(
+                    ({'text': f'{text} (вариант {number})', 'category': category}
+                     for number in range(options['situations'])
+                     for text, category in [(fake_llm.SITUATIONS[number % len(fake_llm.SITUATIONS)],
+                                             categories[number % len(categories)])]),
+                    near_duplicates=True,
+                )
+                if created != options['situations']:
+                    raise CommandError(f"Добавлено ситуаций: {created} из {options['situations']}")
+                get_sampler().invalidate()
+                result = runner.run(options['players'], options['rounds'], options['concurrency'], options['seed'])
+        finally:
+            api_client._client = None
+            get_sampler().invalidate()
+            server.stop()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            # Файлы журнала WAL остаются, пока открыто соединение потока записи
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
+        result['llm'] = {'requests': server.requests, 'errors': server.errors, 'latency': options['llm_latency']}
+        return result
+
+    def print_report(self, result):
+        self.stdout.write(
+            f"Запросов: {result['requests']} за {result['duration']:.2f} с, RPS: {result['rps']:.1f}; "
+            f"запросов к заглушке API: {result['llm']['requests']} (ошибок {result['llm']['errors']})"
+        )
+        self.stdout.write(f"{'Конечная точка':<16}{'N':>6}{'ош.':>5}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}"
+                          f"{'SQL ср.':>9}{'SQL макс':>9}")
+        for endpoint in runner.ENDPOINTS:
+            stats = result['endpoints'].get(endpoint)
+            if stats is None:
+                continue
+            self.stdout.write(
+                f"{endpoint:<16}{stats['count']:>6}{stats['errors']:>5}"
+                f"{stats['p50'] * 1000:>9.1f}{stats['p95'] * 1000:>9.1f}{stats['p99'] * 1000:>9.1f}"
+                f"{stats['queries_avg']:>9.1f}{stats['queries_max']:>9}"
+            )
@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from game import dedup
+from game.models import GameSession, PlayerAction, Situation
+
+
+class Command(BaseCommand):
+    help = 'Заполняет подписи MinHash и находит (при --delete удаляет) почти одинаковые ситуации'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=settings.SITUATION_DUPLICATE_THRESHOLD,
+                            help='Минимальное сходство для дубля')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--delete', action='store_true',
+                            help='Удалить дубли, оставив самую старую ситуацию группы')
+
+    def handle(self, *args, **options):
+        filled = self.backfill(options['batch_size'])
+        if filled:
+            self.stdout.write(f'Подписи посчитаны для {filled} ситуаций')
+
+        groups = self.find_groups(options['threshold'])
+        duplicates = [situation_id for group in groups for situation_id in group[1:]]
+        self.stdout.write(f'Групп почти одинаковых ситуаций: {len(groups)}, лишних ситуаций: {len(duplicates)}')
+        for group in groups[:20]:
+            texts = dict(Situation.objects.filter(id__in=group).values_list('id', 'text'))
+            self.stdout.write(f'- #{group[0]}: {texts[group[0]][:80]}')
+            for situation_id in group[1:]:
+                self.stdout.write(f'    #{situation_id}: {texts[situation_id][:80]}')
+
+        if options['delete'] and duplicates:
+            deleted = self.delete(duplicates)
+            self.stdout.write(self.style.SUCCESS(f'Удалено ситуаций: {deleted}'))
+
+    def backfill(self, batch_size):
+        """Подписи для ситуаций, добавленных до появления поля minhash"""
+        filled = 0
+        while True:
+            batch = list(Situation.objects.filter(minhash__isnull=True).only('id', 'text')[:batch_size])
+            if not batch:
+                break
+            for situation in batch:
+                situation.minhash = dedup.to_bytes(dedup.signature(situation.text))
+            Situation.objects.bulk_update(batch, ['minhash'])
+            filled += len(batch)
+        if filled:
+            dedup.get_index().invalidate()
+        return filled
+
+    def find_groups(self, threshold):
+        """Группы дублей (список id, первым - самая старая) объединением пар кандидатов LSH"""
+        index = dedup.NearDuplicateIndex(load=False)
+        parent = {}
+
+        def root(situation_id):
+            while parent[situation_id] != situation_id:
+                parent[situation_id] = parent[parent[situation_id]]
+                situation_id = parent[situation_id]
+            return situation_id
+
+        rows = Situation.objects.filter(minhash__isnull=False).order_by('id').values_list('id', 'minhash')
+        for situation_id, data in rows.iterator():
+            sig = dedup.from_bytes(data)
+            parent[situation_id] = situation_id
+            match = index.find(sig, threshold)
+            if match:
+                # id растут со временем - корень группы всегда самая старая ситуация
+                parent[situation_id] = root(match[0])
+            index.add(situation_id, sig)
+
+        groups = {}
+        for situation_id in parent:
+            groups.setdefault(root(situation_id), []).append(situation_id)
+        return sorted((sorted(group) for group in groups.values() if len(group) > 1), key=len, reverse=True)
+
+    def delete(self, duplicates):
+        """Удаляет дубли, на которые не ссылаются игры: удаление ситуации каскадно удалило бы их"""
+        deletable = (
+            Situation.objects
+            .filter(id__in=duplicates)
+            .exclude(Exists(GameSession.objects.filter(situation=OuterRef('pk'))))
+            .exclude(Exists(PlayerAction.objects.filter(situation=OuterRef('pk'))))
+        )
+        deleted = 0
+        # Через delete() каждого объекта, чтобы сигналы убрали его из индексов
+        for situation in list(deletable):
+            situation.delete()
+            deleted += 1
+        return deleted
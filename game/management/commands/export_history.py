@@ -0,0 +1,83 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from game import export
+
+
+class Command(BaseCommand):
+    help = 'Выгружает историю действий (с сессией и ситуацией) в сжатый JSONL или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', required=True,
+                            help='Файл выгрузки (.gz - со сжатием); при --partitions к имени добавляется номер части')
+        parser.add_argument('--format', choices=export.FORMATS, default='jsonl', dest='export_format')
+        parser.add_argument('--since', type=int, default=None,
+                            help='Выгрузить только действия с id больше этого')
+        parser.add_argument('--watermark-file',
+                            help='Файл с последним выгруженным id: читается как --since и обновляется после выгрузки')
+        parser.add_argument('--partitions', type=int, default=1,
+                            help='На сколько частей по диапазонам id разбить выгрузку')
+        parser.add_argument('--workers', type=int, default=1, help='Число процессов для выгрузки частей')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Строк в одном запросе к БД')
+
+    def handle(self, *args, **options):
+        since_id = options['since']
+        watermark_file = options['watermark_file']
+        if since_id is None:
+            since_id = self.read_watermark(watermark_file) if watermark_file else 0
+
+        bounds = export.export_bounds(since_id)
+        if bounds is None:
+            self.stdout.write('Новых действий нет')
+            return
+        since_id, until_id = bounds
+
+        ranges = export.partitions(since_id, until_id, max(1, options['partitions']))
+        tasks = [
+            (self.part_path(options['output'], number) if len(ranges) > 1 else options['output'],
+             start, end, options['export_format'], options['chunk_size'])
+            for number, (start, end) in enumerate(ranges)
+        ]
+
+        if options['workers'] > 1 and len(tasks) > 1:
+            # Соединения не должны достаться процессам пула по наследству
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=export.init_worker) as pool:
+                results = list(pool.map(export.export_partition, tasks))
+        else:
+            results = [export.export_partition(task) for task in tasks]
+
+        for path, count in results:
+            self.stdout.write(f'{path}: {count} строк')
+        if watermark_file:
+            self.write_watermark(watermark_file, until_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Выгружено строк: {sum(count for _, count in results)}, последний id: {until_id}'
+        ))
+
+    @staticmethod
+    def part_path(output, number):
+        """history.jsonl.gz -> history.part0.jsonl.gz"""
+        directory, name = os.path.split(output)
+        base, dot, extensions = name.partition('.')
+        return os.path.join(directory, f'{base}.part{number}{dot}{extensions}')
+
+    @staticmethod
+    def read_watermark(path):
+        try:
+            with open(path, encoding='utf-8') as stream:
+                return int(json.load(stream)['last_id'])
+        except FileNotFoundError:
+            return 0
+        except (ValueError, KeyError, TypeError) as error:
+            raise CommandError(f'Некорректный файл отметки {path}: {error}')
+
+    @staticmethod
+    def write_watermark(path, last_id):
+        # Через временный файл, чтобы прерванная запись не испортила отметку
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as stream:
+            json.dump({'last_id': last_id}, stream)
+        os.replace(temporary, path)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from game.seeding import iter_pack, seed_situations
+
+
+class Command(BaseCommand):
+    help = 'Загружает набор ситуаций из файла JSON, JSONL или CSV (можно .gz)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу набора')
+        parser.add_argument('--format', choices=['json', 'jsonl', 'csv'], dest='pack_format',
+                            help='Формат файла (по умолчанию - по расширению)')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            created, skipped = seed_situations(
+                iter_pack(options['path'], options['pack_format']),
+                batch_size=options['batch_size']
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Не удалось загрузить набор: {e}')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Успешно добавлено {created} новых ситуаций (пропущено {skipped})!')
+        )
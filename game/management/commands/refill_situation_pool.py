@@ -0,0 +1,48 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from game.models import Situation
+from game.situation_pool import RateLimiter, pool_size, refill
+
+
+class Command(BaseCommand):
+    help = 'Пополняет пул заранее сгенерированных ИИ ситуаций'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--category', action='append', dest='categories',
+                            help='Категория (можно указать несколько раз, по умолчанию все)')
+        parser.add_argument('--watermark', type=int, default=settings.SITUATION_POOL_WATERMARK,
+                            help='Сколько ситуаций держать в пуле каждой категории')
+        parser.add_argument('--batch-size', type=int, default=settings.SITUATION_POOL_BATCH_SIZE,
+                            help='Максимум генераций за один проход')
+        parser.add_argument('--workers', type=int, default=settings.SITUATION_POOL_WORKERS,
+                            help='Число одновременных запросов к API')
+        parser.add_argument('--rate', type=int, default=settings.SITUATION_POOL_RATE,
+                            help='Максимум запросов к API в минуту (0 - без ограничения)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Работать постоянно, проверяя пул каждые --interval секунд')
+        parser.add_argument('--interval', type=float, default=10.0)
+
+    def handle(self, *args, **options):
+        categories = options['categories'] or [value for value, _ in Situation.CATEGORY_CHOICES]
+        rate_limiter = RateLimiter(options['rate'])
+
+        while True:
+            for category in categories:
+                added = refill(
+                    category,
+                    options['watermark'],
+                    options['batch_size'],
+                    options['workers'],
+                    rate_limiter
+                )
+                if added:
+                    self.stdout.write(
+                        f'{category}: добавлено {added}, в пуле {pool_size(category)}'
+                    )
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Пул ситуаций пополнен!'))
@@ -0,0 +1,112 @@
+import json
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from game import replay
+from game.benchmark import fake_llm
+from game.models import PlayerAction
+
+
+class Command(BaseCommand):
+    help = 'Прогоняет исторические действия игроков через оценщик и сравнивает с записанными вердиктами'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=replay.BACKENDS, default='stub',
+                            help='llm - настоящее API, stub - локальная заглушка, fallback - резервная '
+                                 'эвристика, scorer - локальная модель')
+        parser.add_argument('--evaluator', metavar='DOTTED.PATH',
+                            help='Своя функция (ситуация, план) -> (survived или None, текст ответа)')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='thread - для оценщиков, ждущих сеть, process - для вычислительных')
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--source', default='all',
+                            help="Источник исторических вердиктов ('all' - любые). У действий, сделанных "
+                                 "до появления источника и ситуации в записи, источник пустой, а ситуация "
+                                 "не сохранилась: их оценивают по одному плану")
+        parser.add_argument('--limit', type=int, help='Не больше N последних действий')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--output', metavar='PATH', help='Результаты по действиям в JSONL')
+        parser.add_argument('--stub-latency', default='fixed:0', help='Задержка заглушки (см. benchmark)')
+
+    def handle(self, *args, **options):
+        overrides = {}
+        server = None
+        if options['backend'] == 'stub':
+            server = fake_llm.FakeLLMServer(options['stub_latency'])
+            # Заглушку не ограничиваем: лимит защищает квоту настоящего API
+            overrides = {'DEEPSEEK_API_KEY': 'replay', 'DEEPSEEK_API_URL': server.start(), 'LLM_MAX_INFLIGHT': 0}
+
+        output = open(options['output'], 'w', encoding='utf-8') if options['output'] else None
+        summary = replay.ReplaySummary()
+        try:
+            with override_settings(**overrides):
+                executor = self.make_executor(options, overrides)
+                with executor:
+                    for chunk in self.iter_chunks(options):
+                        for record in executor.map(replay.replay_one, chunk, chunksize=max(len(chunk) // (options['workers'] * 4), 1)):
+                            summary.add(record)
+                            if output:
+                                output.write(json.dumps(record) + '\n')
+        except ValueError as e:
+            raise CommandError(str(e))
+        finally:
+            if output:
+                output.close()
+            if server:
+                server.stop()
+
+        if not summary.total:
+            raise CommandError(f"Нет оцененных действий с источником вердикта '{options['source']}'")
+        result = summary.as_dict()
+        if output:
+            with open(options['output'], 'a', encoding='utf-8') as summary_file:
+                summary_file.write(json.dumps({'summary': result}) + '\n')
+        self.print_summary(result)
+
+    def make_executor(self, options, overrides):
+        initargs = (options['backend'], options['evaluator'], overrides)
+        if options['pool'] == 'process':
+            # Дочерние процессы не должны унаследовать открытые соединения с БД
+            connections.close_all()
+            return ProcessPoolExecutor(max_workers=options['workers'], initializer=replay.init_worker, initargs=initargs)
+        replay.init_worker(*initargs)
+        return ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='replay')
+
+    def iter_chunks(self, options):
+        """Действия порциями по id (без долгого курсора: в пуле могут стартовать процессы)"""
+        actions = PlayerAction.objects.filter(is_pending=False)
+        if options['source'] != 'all':
+            actions = actions.filter(verdict_source=options['source'])
+        if options['limit']:
+            last_ids = list(actions.order_by('-id').values_list('id', flat=True)[:options['limit']])
+            if not last_ids:
+                return
+            actions = actions.filter(id__gte=min(last_ids))
+
+        last_id = 0
+        while True:
+            chunk = list(
+                actions.filter(id__gt=last_id)
+                .order_by('id')
+                .values_list('id', 'situation__text', 'action_text', 'survived')[:options['chunk_size']]
+            )
+            if not chunk:
+                return
+            last_id = chunk[-1][0]
+            yield chunk
+
+    def print_summary(self, result):
+        self.stdout.write(
+            f"Действий: {result['total']}, с вердиктом: {result['decided']}, без вердикта: {result['undecided']}"
+        )
+        self.stdout.write(f"Согласие с историей: {result['agreement']:.1%}")
+        self.stdout.write(
+            f"Доля выживших: {result['predicted_survival_rate']:.1%} "
+            f"(в истории {result['expected_survival_rate']:.1%}); матрица ошибок: {result['confusion']}"
+        )
+        latency = result['latency_ms']
+        self.stdout.write(f"Задержка, мс: p50 {latency['p50']:.1f}, p95 {latency['p95']:.1f}, p99 {latency['p99']:.1f}")
+        self.stdout.write(
+            f"Токены (оценка): промпт {result['prompt_tokens']}, ответ {result['completion_tokens']}"
+        )
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from game.analytics import update_rollups
+
+
+class Command(BaseCommand):
+    help = 'Обновляет часовые сводки действий для страницы аналитики в админке'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Работать постоянно, обновляя сводки каждые --interval секунд')
+        parser.add_argument('--interval', type=float, default=300.0)
+
+    def handle(self, *args, **options):
+        while True:
+            updated = update_rollups()
+            self.stdout.write(f'Обновлено строк сводки: {updated}')
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
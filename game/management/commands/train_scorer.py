@@ -0,0 +1,69 @@
+import random
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from game import scorer
+from game.models import PlayerAction
+
+
+class Command(BaseCommand):
+    help = 'Обучает локальную модель оценки планов на вердиктах ИИ из истории действий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.SURVIVAL_SCORER_PATH,
+                            help='Куда сохранить модель (по умолчанию SURVIVAL_SCORER_PATH)')
+        parser.add_argument('--include-unknown', action='store_true',
+                            help='Учитывать действия без источника вердикта (сделанные до его записи)')
+        parser.add_argument('--holdout', type=float, default=0.2, help='Доля действий для проверки')
+        parser.add_argument('--epochs', type=int, default=200)
+        parser.add_argument('--min-rows', type=int, default=100, help='Минимум действий для обучения')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        # Резервные вердикты случайны, а вердикты кэша и модели - копии, учим только на ИИ
+        sources = ['llm', ''] if options['include_unknown'] else ['llm']
+        rows = list(
+            PlayerAction.objects
+            .filter(is_pending=False, verdict_source__in=sources)
+            .values_list('action_text', 'survived')
+        )
+        if len(rows) < options['min_rows']:
+            raise CommandError(f"Недостаточно вердиктов ИИ для обучения: {len(rows)} < {options['min_rows']}")
+
+        random.Random(options['seed']).shuffle(rows)
+        split = int(len(rows) * (1 - options['holdout']))
+        train_rows, test_rows = rows[:split], rows[split:]
+
+        self.stdout.write(f"Обучение на {len(train_rows)} действиях ({'NumPy' if scorer.numpy else 'без NumPy'})...")
+        model = scorer.train(
+            [plan for plan, _ in train_rows],
+            [survived for _, survived in train_rows],
+            epochs=options['epochs']
+        )
+
+        if test_rows:
+            self.report(model, test_rows)
+
+        if not options['output']:
+            raise CommandError('Не задан путь для сохранения модели (--output или SURVIVAL_SCORER_PATH)')
+        model.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(f"Модель сохранена в {options['output']}"))
+
+    def report(self, model, rows):
+        """Точность на отложенных действиях и доля, решаемая без ИИ"""
+        confidence = settings.SURVIVAL_SCORER_CONFIDENCE
+        correct = 0
+        confident = 0
+        confident_correct = 0
+        for plan, survived in rows:
+            probability = model.probability(plan)
+            correct += (probability >= 0.5) == survived
+            prediction = model.predict(plan, confidence)
+            if prediction is not None:
+                confident += 1
+                confident_correct += prediction == survived
+
+        self.stdout.write(f'Точность на {len(rows)} отложенных действиях: {correct / len(rows):.1%}')
+        self.stdout.write(
+            f'Уверенных прогнозов (порог {confidence}): {confident / len(rows):.1%}, '
+            f'их точность: {confident_correct / confident if confident else 0:.1%}'
+        )
@@ -0,0 +1,188 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from . import profiling
+
+# Границы корзин гистограмм задержек (сек)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+PREFIX = 'deathbyai_'
+
+_HELP = {
+    'view_requests_total': 'Запросы к страницам по view и статусу',
+    'view_latency_seconds': 'Время обработки запроса по view',
+    'db_queries_per_request': 'Число SQL-запросов на один HTTP-запрос',
+    'db_time_seconds': 'Суммарное время SQL-запросов на один HTTP-запрос',
+    'llm_call_seconds': 'Время вызова методов DeepSeekClient',
+    'llm_responses_total': 'Ответы API DeepSeek по коду статуса',
+    'llm_fallbacks_total': 'Переходы на резервную логику без ИИ',
+    'llm_batch_size': 'Число планов в одном пакетном запросе к ИИ',
+    'rate_limited_total': 'Запросы, отклоненные лимитом частоты',
+    'llm_local_verdicts_total': 'Вердикты локальной модели без запроса к ИИ',
+}
+
+
+class _Shard:
+    """Данные одного потока: пишет только владелец, поэтому блокировки не нужны"""
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+class Registry:
+    """Сборщик метрик без блокировок на горячем пути.
+
+    Каждый поток пишет в свой шард, при выдаче /metrics шарды суммируются.
+    Блокировка берется только при появлении нового потока и при выдаче.
+    Шарды завершившихся потоков сворачиваются в общий архивный шард.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._retired = _Shard()
+        self._shards_lock = threading.Lock()
+        self._buckets = {}
+        self._gauges = {}
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        counters = self._shard().counters
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        self._buckets.setdefault(name, buckets)
+        key = (name, tuple(sorted(labels.items())))
+        histograms = self._shard().histograms
+        histogram = histograms.get(key)
+        if histogram is None:
+            # [счетчики по корзинам + переполнение, сумма, количество]
+            histogram = histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0]
+        histogram[0][bisect_left(buckets, value)] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    def register_gauge(self, name, help_text, collect):
+        """collect() возвращает список пар (labels, значение) и вызывается при выдаче"""
+        self._gauges[name] = (help_text, collect)
+
+    def _merged(self):
+        counters = {}
+        histograms = {}
+        with self._shards_lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    _merge_into(self._retired.counters, self._retired.histograms, shard)
+            self._shards = alive
+            shards = [self._retired] + [shard for _, shard in alive]
+        for shard in shards:
+            _merge_into(counters, histograms, shard)
+        return counters, histograms
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        counters, histograms = self._merged()
+        lines = []
+        described = set()
+
+        def describe(name, kind, help_text):
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {PREFIX}{name} {help_text}')
+                lines.append(f'# TYPE {PREFIX}{name} {kind}')
+
+        for (name, labels), value in sorted(counters.items()):
+            describe(name, 'counter', _HELP.get(name, name))
+            lines.append(f'{PREFIX}{name}{_format_labels(labels)} {value}')
+
+        for (name, labels), (bucket_counts, total, count) in sorted(histograms.items()):
+            describe(name, 'histogram', _HELP.get(name, name))
+            cumulative = 0
+            for bound, bucket_count in zip(self._buckets[name], bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{PREFIX}{name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{PREFIX}{name}_count{_format_labels(labels)} {count}')
+
+        for name, (help_text, collect) in sorted(self._gauges.items()):
+            describe(name, 'gauge', help_text)
+            for labels, value in collect():
+                lines.append(f'{PREFIX}{name}{_format_labels(tuple(sorted(labels.items())))} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _merge_into(counters, histograms, shard):
+    for key, value in list(shard.counters.items()):
+        counters[key] = counters.get(key, 0) + value
+    for key, (bucket_counts, total, count) in list(shard.histograms.items()):
+        merged = histograms.setdefault(key, [[0] * len(bucket_counts), 0.0, 0])
+        merged[0] = [a + b for a, b in zip(merged[0], bucket_counts)]
+        merged[1] += total
+        merged[2] += count
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        key + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+registry = Registry()
+
+
+def timed(name, **labels):
+    """Декоратор: время выполнения функции в гистограмму name"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                registry.observe(name, elapsed, **labels)
+                profiling.record_call(name, elapsed, **labels)
+        return wrapper
+    return decorator
+
+
+def _verdict_cache_stats():
+    from .verdict_cache import get_verdict_cache
+    verdict_cache = get_verdict_cache()
+    if verdict_cache is None:
+        return []
+    stats = verdict_cache.stats()
+    return [({'stat': name}, stats[name]) for name in ('hits', 'misses', 'hit_ratio', 'saved_seconds')]
+
+
+def _breaker_state():
+    from . import api_client
+    # Клиент не создаем ради метрики - до первого запроса цепь замкнута
+    client = api_client._client
+    state = client.breaker.state if client else 'closed'
+    return [({'state': name}, int(name == state)) for name in ('closed', 'open', 'half-open')]
+
+
+def register_default_gauges():
+    registry.register_gauge('verdict_cache', 'Статистика кэша вердиктов', _verdict_cache_stats)
+    registry.register_gauge('llm_circuit_state', 'Состояние предохранителя API DeepSeek', _breaker_state)
@@ -0,0 +1,77 @@
+import random
+import time
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from . import profiling
+from .metrics import COUNT_BUCKETS, registry
+
+
+class _QueryTimer:
+    """execute_wrapper: считает SQL-запросы и их суммарное время"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Задержка, статус и SQL-запросы каждого запроса - в метрики по имени view"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else 'unresolved'
+        registry.inc('view_requests_total', view=view, status=response.status_code)
+        registry.observe('view_latency_seconds', elapsed, view=view)
+        registry.observe('db_queries_per_request', timer.count, buckets=COUNT_BUCKETS, view=view)
+        registry.observe('db_time_seconds', timer.seconds, view=view)
+        return response
+
+
+class ProfilingMiddleware:
+    """Снимки запросов: cProfile для доли PROFILE_SAMPLE_RATE запросов,
+    SQL и вызовы DeepSeekClient для запросов дольше PROFILE_SLOW_THRESHOLD.
+
+    Снимки пишутся в кольцевой буфер RequestProfile и смотрятся в админке.
+    Вне выборки запрос платит только за запись текста SQL-запросов.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILE_SAMPLE_RATE and not settings.PROFILE_SLOW_THRESHOLD:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sampled = random.random() < settings.PROFILE_SAMPLE_RATE
+        capture = profiling.start(sampled)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(capture):
+                response = self.get_response(request)
+        finally:
+            profiling.finish()
+        elapsed = time.perf_counter() - started
+
+        slow = bool(settings.PROFILE_SLOW_THRESHOLD) and elapsed >= settings.PROFILE_SLOW_THRESHOLD
+        if sampled or slow:
+            match = request.resolver_match
+            view = (match.url_name or match.view_name) if match else 'unresolved'
+            profiling.save(capture, request, response, view, elapsed, 'slow' if slow else 'sampled')
+        return response
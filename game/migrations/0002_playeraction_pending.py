@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playeraction',
+            name='is_pending',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='playeraction',
+            name='situation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='game.situation'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:39
+
+import django.db.models.deletion
+from datetime import date, timedelta
+from django.db import migrations, models
+
+
+def backfill_best_scores(apps, schema_editor):
+    """Заполняет общий зачет по уже сыгранным сессиям"""
+    GameSession = apps.get_model('game', 'GameSession')
+    BestScore = apps.get_model('game', 'BestScore')
+
+    best = {}
+    sessions = GameSession.objects.order_by('score', 'id').values_list('id', 'player_id', 'score', 'created_at')
+    for session_id, player_id, score, created_at in sessions.iterator():
+        day = created_at.date()
+        for period, start in (
+            ('all', date(2000, 1, 1)),
+            ('day', day),
+            ('week', day - timedelta(days=day.weekday())),
+        ):
+            # Сессии идут по возрастанию счета - последняя и есть лучшая
+            best[(period, start, player_id)] = (session_id, score)
+
+    BestScore.objects.bulk_create(
+        [
+            BestScore(player_id=player_id, session_id=session_id, period=period,
+                      period_start=start, category='', score=score)
+            for (period, start, player_id), (session_id, score) in best.items()
+        ],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0002_playeraction_pending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BestScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('all', 'За все время'), ('day', 'За день'), ('week', 'За неделю')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('category', models.CharField(blank=True, default='', max_length=20)),
+                ('score', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.player')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='game.gamesession')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'period_start', 'category', '-score'], name='best_score_board_idx')],
+                'constraints': [models.UniqueConstraint(fields=('period', 'period_start', 'category', 'player'), name='unique_best_score_per_board')],
+            },
+        ),
+        migrations.RunPython(backfill_best_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0003_bestscore'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='situation',
+            name='is_reserved',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:41
+
+import hashlib
+from django.db import migrations, models
+
+
+def fill_text_hashes(apps, schema_editor):
+    """Заполняет хэши текстов; у дублей хэш остается пустым"""
+    Situation = apps.get_model('game', 'Situation')
+    seen = set()
+    for situation in Situation.objects.order_by('id').only('id', 'text').iterator():
+        text_hash = hashlib.sha1(' '.join(situation.text.split()).lower().encode('utf-8')).hexdigest()
+        if text_hash in seen:
+            continue
+        seen.add(text_hash)
+        Situation.objects.filter(id=situation.id).update(text_hash=text_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0004_situation_is_reserved'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='situation',
+            name='text_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True, unique=True),
+        ),
+        migrations.RunPython(fill_text_hashes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(fields=['player', 'is_active'], name='session_player_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(fields=['-score'], name='session_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playeraction',
+            index=models.Index(fields=['game_session', '-created_at'], name='action_session_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0006_llmlease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playeraction',
+            name='verdict_source',
+            field=models.CharField(blank=True, choices=[('llm', 'ИИ'), ('cache', 'Кэш вердиктов'), ('scorer', 'Локальная модель'), ('fallback', 'Резервная оценка')], default='', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0007_playeraction_verdict_source'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='situation',
+            name='minhash',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0008_situation_minhash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamesession',
+            name='seen_situations',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
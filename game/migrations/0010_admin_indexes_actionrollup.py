@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0009_gamesession_seen_situations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('category', models.CharField(blank=True, default='', max_length=20)),
+                ('actions', models.IntegerField(default=0)),
+                ('survived', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(fields=['created_at'], name='session_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playeraction',
+            index=models.Index(fields=['created_at'], name='action_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='actionrollup',
+            constraint=models.UniqueConstraint(fields=('hour', 'category'), name='unique_action_rollup'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0010_admin_indexes_actionrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.IntegerField(unique=True)),
+                ('captured_at', models.DateTimeField()),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('view_name', models.CharField(max_length=100)),
+                ('status', models.IntegerField()),
+                ('duration_ms', models.FloatField()),
+                ('reason', models.CharField(choices=[('sampled', 'Выборка'), ('slow', 'Медленный запрос')], max_length=10)),
+                ('query_count', models.IntegerField(default=0)),
+                ('queries', models.JSONField(default=list)),
+                ('llm_calls', models.JSONField(default=list)),
+                ('stats', models.TextField(blank=True)),
+                ('profile', models.BinaryField(null=True)),
+            ],
+            options={
+                'ordering': ['-captured_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:14
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def resolve_duplicate_pending(apps, schema_editor):
+    """Перед уникальным индексом: у сессии остается только последнее ожидающее действие"""
+    PlayerAction = apps.get_model('game', 'PlayerAction')
+    latest = (
+        PlayerAction.objects
+        .filter(is_pending=True)
+        .values('game_session')
+        .annotate(last_id=Max('id'))
+        .values_list('last_id', flat=True)
+    )
+    PlayerAction.objects.filter(is_pending=True).exclude(id__in=list(latest)).update(
+        is_pending=False,
+        feedback='Вердикт не получен'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0011_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playeraction',
+            name='evaluation_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(resolve_duplicate_pending, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='playeraction',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_pending', True)), fields=('game_session',), name='one_pending_action_per_session'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+from django.db import migrations
+from django.db.models import Count
+
+
+def backfill_category_scores(apps, schema_editor):
+    """Заполняет зачеты категорий по уже сыгранным сессиям (0003 заполнила только общий)"""
+    PlayerAction = apps.get_model('game', 'PlayerAction')
+    BestScore = apps.get_model('game', 'BestScore')
+
+    best = {}
+    rows = (
+        PlayerAction.objects
+        .filter(survived=True, is_pending=False, situation__isnull=False)
+        .values('game_session_id', 'game_session__player_id', 'game_session__created_at', 'situation__category')
+        .annotate(score=Count('id'))
+        .order_by('score', 'game_session_id')
+    )
+    for row in rows.iterator():
+        day = row['game_session__created_at'].date()
+        for period, start in (
+            ('all', date(2000, 1, 1)),
+            ('day', day),
+            ('week', day - timedelta(days=day.weekday())),
+        ):
+            # Сессии идут по возрастанию счета - последняя и есть лучшая
+            best[(period, start, row['situation__category'], row['game_session__player_id'])] = (
+                row['game_session_id'], row['score']
+            )
+
+    # Строки, уже записанные record_score, не трогаем
+    BestScore.objects.bulk_create(
+        [
+            BestScore(player_id=player_id, session_id=session_id, period=period,
+                      period_start=start, category=category, score=score)
+            for (period, start, category, player_id), (session_id, score) in best.items()
+        ],
+        batch_size=500,
+        ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0012_pending_action_lease'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_category_scores, migrations.RunPython.noop),
+    ]
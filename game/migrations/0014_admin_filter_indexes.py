@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0013_backfill_category_best_scores'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gamesession',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at'], name='session_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playeraction',
+            index=models.Index(fields=['verdict_source', 'created_at'], name='action_source_created_idx'),
+        ),
+    ]
@@ -1,4 +1,6 @@
+import hashlib
 from django.db import models
+from . import dedup
 
 class Player(models.Model):
     CATEGORY_CHOICES = [
@@ -21,13 +23,34 @@ class Situation(models.Model):
     ]
     
     text = models.TextField()
+    # Хэш нормализованного текста для поиска дублей без сравнения полного текста
+    text_hash = models.CharField(max_length=40, unique=True, null=True, blank=True, editable=False)
+    # Подпись MinHash для поиска перефразированных дублей (game.dedup)
+    minhash = models.BinaryField(null=True, blank=True, editable=False)
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
     created_by = models.ForeignKey(Player, on_delete=models.CASCADE, null=True, blank=True)
     is_user_created = models.BooleanField(default=False)
+    # Заранее сгенерированная ситуация, еще не выданная игроку (в игре не участвует)
+    is_reserved = models.BooleanField(default=False, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return f"{self.category}: {self.text[:50]}..."
+    
+    @staticmethod
+    def hash_text(text):
+        """Хэш текста без учета регистра и лишних пробелов"""
+        return hashlib.sha1(' '.join(text.split()).lower().encode('utf-8')).hexdigest()
+    
+    def save(self, *args, **kwargs):
+        # Хэш и подпись пересчитываются при каждом изменении текста
+        text_hash = self.hash_text(self.text)
+        if text_hash != self.text_hash or self.minhash is None:
+            self.text_hash = text_hash
+            self.minhash = dedup.to_bytes(dedup.signature(self.text))
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'text_hash', 'minhash'}
+        super().save(*args, **kwargs)
 
 class GameSession(models.Model):
     player = models.ForeignKey(Player, on_delete=models.CASCADE)
@@ -35,17 +58,148 @@ class GameSession(models.Model):
     lives = models.IntegerField(default=3)
     score = models.IntegerField(default=0)
     is_active = models.BooleanField(default=True)
+    # Уже показанные ситуации (сжатая битовая карта deck.SeenSet)
+    seen_situations = models.BinaryField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    class Meta:
+        indexes = [
+            # Завершение активных сессий игрока в start_game
+            models.Index(fields=['player', 'is_active'], name='session_player_active_idx'),
+            models.Index(fields=['-score'], name='session_score_idx'),
+            models.Index(fields=['created_at'], name='session_created_idx'),
+            # Фильтр активных сессий в админке. Django сравнивает булево поле без
+            # значения (WHERE is_active), поэтому SQLite подходит только частичный индекс
+            models.Index(fields=['created_at'], condition=models.Q(is_active=True),
+                         name='session_active_created_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.player.name} - Score: {self.score}"
 
 class PlayerAction(models.Model):
+    VERDICT_SOURCE_CHOICES = [
+        ('llm', 'ИИ'),
+        ('cache', 'Кэш вердиктов'),
+        ('scorer', 'Локальная модель'),
+        ('fallback', 'Резервная оценка'),
+    ]
+    
     game_session = models.ForeignKey(GameSession, on_delete=models.CASCADE)
+    # Ситуация, в которой было сделано действие (у сессии она меняется каждый раунд)
+    situation = models.ForeignKey(Situation, on_delete=models.SET_NULL, null=True, blank=True)
     action_text = models.TextField()
     survived = models.BooleanField(default=False)
     feedback = models.TextField()
+    # Действие ждет вердикта ИИ (асинхронная оценка)
+    is_pending = models.BooleanField(default=False)
+    # Аренда оценки: когда ее взял фоновый поток или SSE-поток (evaluation.claim)
+    evaluation_started_at = models.DateTimeField(null=True, blank=True)
+    # Кто вынес вердикт; пусто - действие сделано до появления этого поля
+    verdict_source = models.CharField(max_length=10, choices=VERDICT_SOURCE_CHOICES, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            # Последнее действие сессии в result_page
+            models.Index(fields=['game_session', '-created_at'], name='action_session_created_idx'),
+            # Иерархия дат в админке и сводки по часам
+            models.Index(fields=['created_at'], name='action_created_idx'),
+            # Фильтр по источнику вердикта в админке вместе с иерархией дат
+            models.Index(fields=['verdict_source', 'created_at'], name='action_source_created_idx'),
+        ]
+        constraints = [
+            # Не больше одного ожидающего вердикта действия на сессию
+            models.UniqueConstraint(fields=['game_session'], condition=models.Q(is_pending=True),
+                                    name='one_pending_action_per_session'),
+        ]
+    
+    def __str__(self):
+        return f"{self.game_session.player.name} - Survived: {self.survived}"
+
+class BestScore(models.Model):
+    """Лучший результат игрока в таблице лидеров (обновляется при каждом раунде)"""
+    PERIOD_CHOICES = [
+        ('all', 'За все время'),
+        ('day', 'За день'),
+        ('week', 'За неделю'),
+    ]
+    
+    player = models.ForeignKey(Player, on_delete=models.CASCADE)
+    session = models.ForeignKey(GameSession, on_delete=models.CASCADE)
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    # Пустая категория - общий зачет по всем категориям
+    category = models.CharField(max_length=20, blank=True, default='')
+    score = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'period_start', 'category', 'player'],
+                name='unique_best_score_per_board'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['period', 'period_start', 'category', '-score'], name='best_score_board_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.player.name} - {self.period}/{self.category or 'all'}: {self.score}"
+
+class LLMLease(models.Model):
+    """Аренда одинакового запроса к ИИ: его выполняет один воркер, остальные ждут результат"""
+    key = models.CharField(max_length=64, unique=True)
+    owner = models.CharField(max_length=64)
+    expires_at = models.DateTimeField(db_index=True)
+    is_completed = models.BooleanField(default=False)
+    result = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"{self.game_session.player.name} - Survived: {self.survived}"
\ No newline at end of file
+        return f"{self.key} ({'готово' if self.is_completed else 'выполняется'})"
+
+class ActionRollup(models.Model):
+    """Сводка действий за час по категории ситуации (заполняет команда rollup_actions)"""
+    hour = models.DateTimeField()
+    # Пустая категория - ситуация действия удалена
+    category = models.CharField(max_length=20, blank=True, default='')
+    actions = models.IntegerField(default=0)
+    survived = models.IntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'category'], name='unique_action_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} {self.category or '-'}: {self.survived}/{self.actions}"
+
+class RequestProfile(models.Model):
+    """Снимок запроса из кольцевого буфера ProfilingMiddleware (slot перезаписывается по кругу)"""
+    REASON_CHOICES = [
+        ('sampled', 'Выборка'),
+        ('slow', 'Медленный запрос'),
+    ]
+    
+    slot = models.IntegerField(unique=True)
+    captured_at = models.DateTimeField()
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    view_name = models.CharField(max_length=100)
+    status = models.IntegerField()
+    duration_ms = models.FloatField()
+    reason = models.CharField(max_length=10, choices=REASON_CHOICES)
+    query_count = models.IntegerField(default=0)
+    queries = models.JSONField(default=list)
+    llm_calls = models.JSONField(default=list)
+    # Топ функций по cumulative и сам профиль в формате pstats (только для запросов из выборки)
+    stats = models.TextField(blank=True)
+    profile = models.BinaryField(null=True)
+    
+    class Meta:
+        ordering = ['-captured_at']
+    
+    def __str__(self):
+        return f"{self.method} {self.path} - {self.duration_ms:.0f} мс"
@@ -0,0 +1,81 @@
+import hashlib
+import time
+from functools import wraps
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+
+def get_version(scope):
+    """Версия данных, от которых зависит страница.
+
+    Начальное значение - текущее время, а не 1: если ключ вытеснят из кэша,
+    новая версия не совпадет со старой и не поднимет устаревшую страницу.
+    """
+    return cache.get_or_set(f'page:version:{scope}', time.time_ns, None)
+
+
+def bump_version(scope):
+    """Меняет версию после фиксации транзакции.
+
+    Сброс до фиксации позволил бы параллельному запросу закэшировать
+    страницу по еще незафиксированным данным под новой версией.
+    """
+    transaction.on_commit(lambda: _bump(scope))
+
+
+def _bump(scope):
+    try:
+        cache.incr(f'page:version:{scope}')
+    except ValueError:
+        cache.set(f'page:version:{scope}', time.time_ns(), None)
+
+
+def session_scope(session_id):
+    return f'session:{session_id}'
+
+
+def cached_page(version_func=None, timeout=600):
+    """Кэширует страницу по версии ее данных и отвечает 304 на условные GET.
+
+    version_func(request, *args, **kwargs) возвращает версию (None - не кэшировать);
+    без нее страница считается неизменной и живет в кэше timeout секунд.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            version = version_func(request, *args, **kwargs) if version_func else 'static'
+            if version is None:
+                return view(request, *args, **kwargs)
+
+            key = hashlib.md5(f'{request.get_full_path()}:{version}'.encode()).hexdigest()
+            etag = f'"{key}"'
+
+            # Браузер уже видел эту версию - даже кэш страниц не трогаем
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                not_modified['ETag'] = etag
+                return not_modified
+
+            entry = cache.get(f'page:html:{key}')
+            if entry is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return response
+                last_modified = time.time()
+                cache.set(f'page:html:{key}', (response.content, response['Content-Type'], last_modified), timeout)
+            else:
+                content, content_type, last_modified = entry
+                response = HttpResponse(content, content_type=content_type)
+
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            # Браузер может хранить страницу, но должен сверять версию перед показом
+            patch_cache_control(response, no_cache=True)
+            return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+        return wrapper
+    return decorator
@@ -0,0 +1,115 @@
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import time
+from django.conf import settings
+from django.utils import timezone
+
+# Ограничения на размер одного снимка
+MAX_QUERIES = 200
+MAX_SQL_LENGTH = 1000
+STATS_LINES = 40
+
+_local = threading.local()
+
+
+class Capture:
+    """Данные одного запроса: SQL-запросы, вызовы DeepSeekClient и профиль (если запрос в выборке)"""
+
+    def __init__(self, profile):
+        self.queries = []
+        self.query_count = 0
+        self.calls = []
+        self.profiler = None
+        if profile:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # В потоке уже работает другой профилировщик - снимаем без профиля
+                pass
+            else:
+                self.profiler = profiler
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper: текст и время SQL-запросов (без параметров)"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_count += 1
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append({'sql': sql[:MAX_SQL_LENGTH], 'ms': round((time.perf_counter() - started) * 1000, 3)})
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+
+
+def start(profile):
+    capture = _local.capture = Capture(profile)
+    return capture
+
+
+def finish():
+    capture = _local.capture
+    _local.capture = None
+    capture.stop()
+    return capture
+
+
+def record_call(name, seconds, **labels):
+    """Вызов, измеренный metrics.timed, - в снимок текущего запроса (если он снимается)"""
+    capture = getattr(_local, 'capture', None)
+    if capture is not None:
+        capture.calls.append({'name': name, **labels, 'ms': round(seconds * 1000, 3)})
+
+
+def _next_slot():
+    """Слот кольцевого буфера: первый свободный, а если свободных нет - самый старый.
+
+    Считается по самой таблице в транзакции записи снимка, поэтому общий
+    для всех воркеров и не зависит от кэша.
+    """
+    from .models import RequestProfile
+    captured = dict(
+        RequestProfile.objects.filter(slot__lt=settings.PROFILE_BUFFER_SIZE).values_list('slot', 'captured_at')
+    )
+    for slot in range(settings.PROFILE_BUFFER_SIZE):
+        if slot not in captured:
+            return slot
+    return min(captured, key=captured.get)
+
+
+def save(capture, request, response, view_name, seconds, reason):
+    """Сохраняет снимок в кольцевой буфер RequestProfile"""
+    from . import write_queue
+    from .models import RequestProfile
+
+    stats_text = ''
+    profile_data = None
+    if capture.profiler is not None:
+        stream = io.StringIO()
+        stats = pstats.Stats(capture.profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(STATS_LINES)
+        stats_text = stream.getvalue()
+        # Тот же формат, что у pstats.dump_stats: файл открывается snakeviz и pstats
+        profile_data = marshal.dumps(stats.stats)
+
+    defaults = {
+        'captured_at': timezone.now(),
+        'method': request.method,
+        'path': request.get_full_path()[:500],
+        'view_name': view_name,
+        'status': response.status_code,
+        'duration_ms': round(seconds * 1000, 3),
+        'reason': reason,
+        'query_count': capture.query_count,
+        'queries': capture.queries,
+        'llm_calls': capture.calls,
+        'stats': stats_text,
+        'profile': profile_data,
+    }
+    write_queue.run(lambda: RequestProfile.objects.update_or_create(slot=_next_slot(), defaults=defaults))
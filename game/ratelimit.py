@@ -0,0 +1,92 @@
+import math
+import random
+import secrets
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from .metrics import registry
+
+
+def take(scope, identity, per_minute, burst):
+    """Берет токен из корзины identity (алгоритм GCRA, состояние - в кэше Django).
+
+    Корзина пополняется per_minute токенами в минуту и вмещает burst.
+    Возвращает 0, если запрос разрешен, иначе - через сколько секунд повторить.
+    Чтение и запись не атомарны: при гонке воркеров изредка проходит лишний запрос.
+    """
+    interval = 60.0 / per_minute
+    key = f'ratelimit:{scope}:{identity}'
+    now = time.time()
+    # Теоретическое время прихода следующего запроса при равномерном потоке
+    arrival = max(cache.get(key, now), now) + interval
+    excess = arrival - now - burst * interval
+    if excess > 0:
+        return excess
+    cache.set(key, arrival, math.ceil(burst * interval) + 1)
+    return 0
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check(request, scope, player_id=None):
+    """Проверяет лимиты scope из RATE_LIMITS по игроку и IP-адресу.
+
+    Возвращает 0 или время до повтора в секундах.
+    """
+    limits = settings.RATE_LIMITS.get(scope, {})
+    identities = {'ip': client_ip(request)}
+    if player_id is not None:
+        identities['player'] = player_id
+
+    for kind, identity in identities.items():
+        if kind not in limits:
+            continue
+        per_minute, burst = limits[kind]
+        retry_after = take(f'{scope}:{kind}', identity, per_minute, burst)
+        if retry_after:
+            registry.inc('rate_limited_total', scope=scope, kind=kind)
+            return retry_after
+    return 0
+
+
+def too_many_requests(retry_after, json=False):
+    """Ответ 429 с заголовком Retry-After"""
+    message = 'Слишком много запросов. Попробуйте через несколько секунд.'
+    if json:
+        response = JsonResponse({'success': False, 'error': message}, status=429)
+    else:
+        response = HttpResponse(message, status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+def acquire_upstream_slot():
+    """Место среди одновременных запросов к API: ключ аренды или None, если мест нет.
+
+    Каждое место - отдельный ключ кэша ratelimit:llm_inflight:<номер>, который
+    живет LLM_INFLIGHT_TTL секунд: место, не возвращенное упавшим воркером,
+    освобождается само, а общий счетчик не может уйти в минус. Между
+    воркерами лимит общий, только если кэш общий (REDIS_URL).
+    """
+    if not settings.LLM_MAX_INFLIGHT:
+        return ''
+    token = secrets.token_hex(8)
+    # Поиск свободного места со случайного номера, чтобы не толкаться на первых
+    offset = random.randrange(settings.LLM_MAX_INFLIGHT)
+    for number in range(settings.LLM_MAX_INFLIGHT):
+        key = f'ratelimit:llm_inflight:{(offset + number) % settings.LLM_MAX_INFLIGHT}'
+        if cache.add(key, token, settings.LLM_INFLIGHT_TTL):
+            return f'{key}:{token}'
+    return None
+
+
+def release_upstream_slot(lease):
+    """Возвращает место, если его аренда не истекла и не досталась другому запросу"""
+    if not lease:
+        return
+    key, _, token = lease.rpartition(':')
+    if cache.get(key) == token:
+        cache.delete(key)
@@ -0,0 +1,125 @@
+import math
+import time
+import django
+from django.apps import apps
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+BACKENDS = ['llm', 'stub', 'fallback', 'scorer']
+
+# Оценщик текущего процесса (в пуле процессов - свой в каждом)
+_evaluator = None
+_messages = None
+
+
+def estimate_tokens(text):
+    """Грубая оценка числа токенов: для русского текста ~3 символа на токен"""
+    return math.ceil(len(text) / 3)
+
+
+def make_evaluator(backend, evaluator_path=None):
+    """Функция (ситуация, план) -> (survived или None, текст ответа).
+
+    None - оценщик не вынес вердикт (API недоступно, модель не уверена).
+    evaluator_path - своя функция с той же сигнатурой, например с новым промптом.
+    """
+    if evaluator_path:
+        return import_string(evaluator_path)
+
+    from .api_client import DeepSeekClient
+    client = DeepSeekClient()
+
+    if backend in ('llm', 'stub'):
+        def evaluate(situation_text, player_plan):
+            # Прямой запрос: кэш вердиктов, локальная модель и объединение запросов пропускаются
+            result = client._request_evaluation(situation_text, player_plan)
+            return result if result else (None, '')
+        return evaluate
+
+    if backend == 'fallback':
+        return lambda situation_text, player_plan: tuple(
+            client._get_strict_fallback_evaluation(situation_text, player_plan)
+        )
+
+    from .scorer import get_scorer
+    model = get_scorer()
+    if model is None:
+        raise ValueError('Локальная модель не обучена (manage.py train_scorer)')
+    return lambda situation_text, player_plan: (
+        model.predict(player_plan, settings.SURVIVAL_SCORER_CONFIDENCE), ''
+    )
+
+
+def init_worker(backend, evaluator_path, overrides):
+    """Инициализация процесса пула: Django, настройки прогона и оценщик"""
+    global _evaluator, _messages
+    if not apps.ready:
+        django.setup()
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    from .api_client import DeepSeekClient
+    _evaluator = make_evaluator(backend, evaluator_path)
+    _messages = DeepSeekClient()._evaluation_messages
+
+
+def replay_one(row):
+    """Оценка одного исторического действия - строка результата для JSONL"""
+    action_id, situation_text, player_plan, expected = row
+    started = time.perf_counter()
+    predicted, response_text = _evaluator(situation_text or '', player_plan)
+    latency = time.perf_counter() - started
+    return {
+        'action_id': action_id,
+        'expected': expected,
+        'predicted': predicted,
+        'agree': None if predicted is None else predicted == expected,
+        'latency_ms': round(latency * 1000, 3),
+        # Промпт считаем всегда - это цена оценки через настоящее API
+        'prompt_tokens': sum(estimate_tokens(message['content'])
+                             for message in _messages(situation_text or '', player_plan)),
+        'completion_tokens': estimate_tokens(response_text),
+    }
+
+
+class ReplaySummary:
+    """Согласие с историческими вердиктами, распределение вердиктов, задержки и токены"""
+
+    def __init__(self):
+        self.total = 0
+        self.undecided = 0
+        self.confusion = {'tp': 0, 'tn': 0, 'fp': 0, 'fn': 0}
+        self.latencies = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, record):
+        self.total += 1
+        self.latencies.append(record['latency_ms'])
+        self.prompt_tokens += record['prompt_tokens']
+        self.completion_tokens += record['completion_tokens']
+        if record['predicted'] is None:
+            self.undecided += 1
+            return
+        key = ('t' if record['agree'] else 'f') + ('p' if record['predicted'] else 'n')
+        self.confusion[key] += 1
+
+    def as_dict(self):
+        from .benchmark.runner import percentile
+        decided = self.total - self.undecided
+        confusion = self.confusion
+        return {
+            'total': self.total,
+            'decided': decided,
+            'undecided': self.undecided,
+            'agreement': (confusion['tp'] + confusion['tn']) / decided if decided else 0.0,
+            'confusion': confusion,
+            'predicted_survival_rate': (confusion['tp'] + confusion['fp']) / decided if decided else 0.0,
+            'expected_survival_rate': (confusion['tp'] + confusion['fn']) / decided if decided else 0.0,
+            'latency_ms': {
+                'p50': percentile(self.latencies, 50),
+                'p95': percentile(self.latencies, 95),
+                'p99': percentile(self.latencies, 99),
+            },
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+        }
@@ -0,0 +1,230 @@
+import random
+import threading
+import time
+from django.conf import settings
+from django.db.models import Q
+from .models import Situation
+
+# Случайных попыток выбрать непоказанную ситуацию до перебора всех id
+UNSEEN_ATTEMPTS = 8
+
+
+class _IdBag:
+    """Множество id с удалением и случайным выбором за O(1)"""
+
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, situation_id):
+        if situation_id not in self.positions:
+            self.positions[situation_id] = len(self.ids)
+            self.ids.append(situation_id)
+
+    def remove(self, situation_id):
+        position = self.positions.pop(situation_id, None)
+        if position is None:
+            return
+        # Переставляем последний элемент на место удаленного
+        last_id = self.ids.pop()
+        if last_id != situation_id:
+            self.ids[position] = last_id
+            self.positions[last_id] = position
+
+    def choice(self, exclude_id=None, seen=None):
+        """Случайный id, отличный от exclude_id (если есть из чего выбрать).
+
+        seen - уже показанные id: из них не выбираем, а если непоказанных
+        не осталось, возвращаем None.
+        """
+        size = len(self.ids)
+        if not size:
+            return None
+        if seen is not None:
+            return self._unseen_choice(exclude_id, seen)
+        index = random.randrange(size)
+        if self.ids[index] == exclude_id and size > 1:
+            # Равномерно выбираем среди остальных элементов
+            index = (index + 1 + random.randrange(size - 1)) % size
+        return self.ids[index]
+
+    def _unseen_choice(self, exclude_id, seen):
+        # Пока показано мало, несколько случайных попыток почти всегда попадают в непоказанное
+        for _ in range(UNSEEN_ATTEMPTS):
+            situation_id = self.ids[random.randrange(len(self.ids))]
+            if situation_id != exclude_id and situation_id not in seen:
+                return situation_id
+        # Колода почти пройдена - выбираем из остатка (проход по памяти, не по таблице)
+        unseen = [situation_id for situation_id in self.ids if situation_id != exclude_id and situation_id not in seen]
+        return random.choice(unseen) if unseen else None
+
+
+def _add(all_ids, by_category, situation_id, category):
+    all_ids.add(situation_id)
+    by_category.setdefault(category, _IdBag()).add(situation_id)
+
+
+def _remove(all_ids, by_category, situation_id):
+    all_ids.remove(situation_id)
+    for bag in by_category.values():
+        bag.remove(situation_id)
+
+
+class SituationSampler:
+    """Индекс id ситуаций по категориям для случайного выбора без загрузки таблицы.
+
+    Индекс строится одним запросом и дополняется сигналами при вставке/удалении.
+    Раз в SITUATION_INDEX_TTL дочитываются только строки с id больше последнего
+    прочитанного и ситуации, которые еще были в пуле, - так воркер видит
+    вставки bulk_create и выдачу из пула в других воркерах. Удаленные в других
+    воркерах ситуации убираются при выборе. Чтение из БД идет без блокировки:
+    пока оно идет, остальные потоки выбирают по старому индексу.
+    """
+
+    def __init__(self):
+        self._all = None
+        self._by_category = {}
+        # Последний прочитанный id и id ситуаций пула: с них начинается дочитывание
+        self._last_id = 0
+        self._reserved = set()
+        self._loaded_at = 0
+        self._generation = 0
+        self._needs_full = True
+        # Изменения, пришедшие во время полного перестроения, - повторяются на новом индексе
+        self._changes = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def _is_fresh(self):
+        return self._all is not None and time.monotonic() - self._loaded_at < settings.SITUATION_INDEX_TTL
+
+    def _ensure_loaded(self):
+        if self._is_fresh():
+            return
+        # Читает один поток; остальные ждут, только если индекса еще нет
+        if not self._refresh_lock.acquire(blocking=self._all is None):
+            return
+        try:
+            if self._is_fresh():
+                return
+            with self._lock:
+                generation = self._generation
+                full = self._needs_full or self._all is None
+                if full:
+                    self._changes = []
+            last_id = 0 if full else self._last_id
+            rows = Situation.objects.values_list('id', 'category', 'is_reserved')
+            if not full:
+                rows = rows.filter(Q(id__gt=last_id) | Q(id__in=self._reserved))
+            rows = list(rows.iterator())
+
+            reserved = set() if full else set(self._reserved) - {situation_id for situation_id, _, _ in rows}
+            with self._lock:
+                if full:
+                    all_ids, by_category = _IdBag(), {}
+                else:
+                    all_ids, by_category = self._all, self._by_category
+                for situation_id, category, is_reserved in rows:
+                    # Заранее сгенерированные ситуации из пула в игре не участвуют
+                    if is_reserved:
+                        reserved.add(situation_id)
+                    else:
+                        _add(all_ids, by_category, situation_id, category)
+                if full:
+                    for change, args in self._changes:
+                        change(all_ids, by_category, *args)
+                    self._all = all_ids
+                    self._by_category = by_category
+                self._reserved = reserved
+                self._last_id = max([last_id, *(situation_id for situation_id, _, _ in rows)])
+                if generation == self._generation:
+                    self._loaded_at = time.monotonic()
+                    if full:
+                        self._needs_full = False
+                else:
+                    # Сброшенный во время чтения индекс мог не увидеть новые строки - перечитаем еще раз
+                    self._loaded_at = 0
+        finally:
+            with self._lock:
+                self._changes = None
+            self._refresh_lock.release()
+
+    def invalidate(self):
+        """Сбрасывает индекс - он будет перечитан целиком при следующем выборе"""
+        with self._lock:
+            self._generation += 1
+            self._needs_full = True
+            self._loaded_at = 0
+
+    def refresh(self):
+        """Новые строки будут дочитаны при следующем выборе (после bulk_create)"""
+        with self._lock:
+            self._loaded_at = 0
+
+    def _change(self, change, *args):
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append((change, args))
+            if self._all is not None:
+                change(self._all, self._by_category, *args)
+
+    def add(self, situation_id, category):
+        self._change(_add, situation_id, category)
+
+    def remove(self, situation_id):
+        self._change(_remove, situation_id)
+
+    def _choose_id(self, exclude_id, category, weights, seen):
+        self._ensure_loaded()
+        with self._lock:
+            if self._all is None:
+                return None
+            if category:
+                bag = self._by_category.get(category)
+            elif weights:
+                categories = [name for name in weights if self._by_category.get(name)]
+                if not categories:
+                    return None
+                chosen = random.choices(categories, [weights[name] for name in categories])[0]
+                bag = self._by_category[chosen]
+                if seen is not None:
+                    # Категория пройдена целиком - берем непоказанную из остальных
+                    situation_id = bag.choice(exclude_id, seen)
+                    return situation_id if situation_id is not None else self._all.choice(exclude_id, seen)
+            else:
+                bag = self._all
+            return bag.choice(exclude_id, seen) if bag else None
+
+    def pick(self, exclude_id=None, category=None, weights=None, seen=None):
+        """Случайная ситуация (по возможности не exclude_id).
+
+        category - выбор только из одной категории,
+        weights - словарь {категория: вес} для взвешенного выбора категории,
+        seen - уже показанные id (deck.SeenSet): None, если показаны все.
+        """
+        if weights is None:
+            weights = settings.SITUATION_CATEGORY_WEIGHTS
+
+        for _ in range(3):
+            situation_id = self._choose_id(exclude_id, category, weights, seen)
+            if situation_id is None:
+                return None
+            situation = Situation.objects.filter(id=situation_id).first()
+            if situation:
+                return situation
+            # Ситуацию удалили в другом воркере - убираем из индекса и пробуем снова
+            self.remove(situation_id)
+
+        self.invalidate()
+        return None
+
+
+_sampler = SituationSampler()
+
+
+def get_sampler():
+    """Общий для процесса индекс ситуаций"""
+    return _sampler
@@ -0,0 +1,182 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from django.conf import settings
+
+try:
+    import numpy
+except ImportError:  # Обучение работает и без NumPy, только медленнее
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FEATURES = 2 ** 18
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def features(text, n_features=DEFAULT_FEATURES):
+    """Хэшированные признаки плана: слова, пары слов и длина плана.
+
+    Возвращает словарь {индекс признака: вес} с единичной нормой.
+    crc32 вместо hash(): индексы должны совпадать между процессами.
+    """
+    words = _WORD_RE.findall(text.lower())
+    tokens = words + [f'{first} {second}' for first, second in zip(words, words[1:])]
+    tokens.append(f'__len_{min(len(words) // 5, 10)}')
+
+    vector = {}
+    for token in tokens:
+        index = zlib.crc32(token.encode()) % n_features
+        vector[index] = vector.get(index, 0.0) + 1.0
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    return {index: value / norm for index, value in vector.items()}
+
+
+def _sigmoid(value):
+    if value < -35:
+        return 0.0
+    return 1.0 / (1.0 + math.exp(-value))
+
+
+class LinearScorer:
+    """Логистическая регрессия по хэшированным признакам плана.
+
+    Предсказание - несколько десятков умножений, без обращения к API.
+    """
+
+    def __init__(self, weights, bias=0.0, n_features=DEFAULT_FEATURES):
+        self.weights = weights
+        self.bias = bias
+        self.n_features = n_features
+
+    def probability(self, plan):
+        """Вероятность выживания по мнению модели"""
+        vector = features(plan, self.n_features)
+        return _sigmoid(self.bias + sum(self.weights.get(index, 0.0) * value for index, value in vector.items()))
+
+    def predict(self, plan, confidence):
+        """True/False для уверенного прогноза, None - если план надо отдать ИИ"""
+        probability = self.probability(plan)
+        if probability >= confidence:
+            return True
+        if probability <= 1 - confidence:
+            return False
+        return None
+
+    def save(self, path):
+        data = {
+            'n_features': self.n_features,
+            'bias': self.bias,
+            # Храним только ненулевые веса
+            'weights': {str(index): weight for index, weight in self.weights.items() if weight},
+        }
+        with open(path, 'w', encoding='utf-8') as model_file:
+            json.dump(data, model_file)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as model_file:
+            data = json.load(model_file)
+        weights = {int(index): weight for index, weight in data['weights'].items()}
+        return cls(weights, data['bias'], data['n_features'])
+
+
+def train(plans, labels, n_features=DEFAULT_FEATURES, epochs=200, learning_rate=1.0, l2=1e-4):
+    """Обучает LinearScorer полным градиентным спуском по логистической функции потерь.
+
+    С NumPy шаг эпохи векторизован, без него считается циклами по тем же
+    формулам: модель на нескольких тысячах ходов обучается и без NumPy.
+    Результаты обоих путей совпадают.
+    """
+    vectors = [features(plan, n_features) for plan in plans]
+    targets = [1.0 if label else 0.0 for label in labels]
+    if numpy is not None:
+        weights, bias = _train_numpy(vectors, targets, n_features, epochs, learning_rate, l2)
+    else:
+        weights, bias = _train_python(vectors, targets, epochs, learning_rate, l2)
+    return LinearScorer(weights, bias, n_features)
+
+
+def _train_python(vectors, targets, epochs, learning_rate, l2):
+    weights = {}
+    bias = 0.0
+    count = len(vectors)
+    for _ in range(epochs):
+        gradient = {}
+        bias_gradient = 0.0
+        for vector, target in zip(vectors, targets):
+            error = _sigmoid(bias + sum(weights.get(index, 0.0) * value for index, value in vector.items())) - target
+            bias_gradient += error
+            for index, value in vector.items():
+                gradient[index] = gradient.get(index, 0.0) + error * value
+        for index in set(gradient) | set(weights):
+            weight = weights.get(index, 0.0)
+            weights[index] = weight - learning_rate * (gradient.get(index, 0.0) / count + l2 * weight)
+        bias -= learning_rate * bias_gradient / count
+    return weights, bias
+
+
+def _train_numpy(vectors, targets, n_features, epochs, learning_rate, l2):
+    # Разреженная матрица признаков в виде трех плоских массивов
+    rows = numpy.repeat(numpy.arange(len(vectors)), [len(vector) for vector in vectors])
+    columns = numpy.fromiter((index for vector in vectors for index in vector), dtype=numpy.int64)
+    values = numpy.fromiter((value for vector in vectors for value in vector.values()), dtype=numpy.float64)
+    target = numpy.array(targets)
+    count = len(vectors)
+
+    weights = numpy.zeros(n_features)
+    bias = 0.0
+    for _ in range(epochs):
+        scores = numpy.bincount(rows, weights=values * weights[columns], minlength=count) + bias
+        error = 1.0 / (1.0 + numpy.exp(-numpy.clip(scores, -35, 35))) - target
+        gradient = numpy.bincount(columns, weights=values * error[rows], minlength=n_features)
+        weights -= learning_rate * (gradient / count + l2 * weights)
+        bias -= learning_rate * error.mean()
+
+    nonzero = numpy.flatnonzero(weights)
+    return dict(zip(nonzero.tolist(), weights[nonzero].tolist())), float(bias)
+
+
+_scorer = None
+_scorer_version = None
+_scorer_checked_at = 0.0
+_scorer_lock = threading.Lock()
+
+
+def get_scorer():
+    """Обученная модель из SURVIVAL_SCORER_PATH (None, если ее нет).
+
+    Файл перечитывается после переобучения, перезапуск не нужен. Время
+    изменения файла проверяется не чаще раза в SURVIVAL_SCORER_CHECK_INTERVAL
+    секунд, а не при каждой оценке.
+    """
+    global _scorer, _scorer_version, _scorer_checked_at
+    path = settings.SURVIVAL_SCORER_PATH
+    if not path:
+        return None
+    with _scorer_lock:
+        now = time.monotonic()
+        if (_scorer_version is not None and _scorer_version[0] == path
+                and now - _scorer_checked_at < settings.SURVIVAL_SCORER_CHECK_INTERVAL):
+            return _scorer
+        _scorer_checked_at = now
+        try:
+            version = (path, os.stat(path).st_mtime)
+        except OSError:
+            version = (path, None)
+        if version != _scorer_version:
+            _scorer = None
+            if version[1] is not None:
+                try:
+                    _scorer = LinearScorer.load(path)
+                except (OSError, ValueError, KeyError, TypeError, AttributeError):
+                    # Испорченный файл не должен ронять оценку: работаем без модели до переобучения
+                    logger.exception('Не удалось загрузить модель оценки из %s', path)
+            _scorer_version = version
+        return _scorer
@@ -0,0 +1,156 @@
+import csv
+import gzip
+import json
+import logging
+from itertools import islice
+from django.db import transaction
+from . import dedup
+from .models import Situation
+from .sampler import get_sampler
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = {value for value, _ in Situation.CATEGORY_CHOICES}
+
+
+def _open_text(path):
+    """Открывает файл набора как текст (поддерживаются .gz-архивы)"""
+    if str(path).endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def _iter_json_array(stream, chunk_size=64 * 1024):
+    """Читает JSON-массив объектов по частям, не загружая файл целиком"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+
+    while True:
+        if not eof and len(buffer) < chunk_size:
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+
+        buffer = buffer.lstrip()
+        if not started:
+            if not buffer:
+                if eof:
+                    return
+                continue
+            if buffer[0] != '[':
+                raise ValueError('Ожидается JSON-массив ситуаций')
+            buffer = buffer[1:]
+            started = True
+            continue
+
+        if buffer.startswith(','):
+            buffer = buffer[1:]
+            continue
+        if buffer.startswith(']'):
+            return
+        if not buffer:
+            if eof:
+                raise ValueError('JSON-массив не закрыт')
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            # Объект еще не дочитан - подгружаем следующий кусок
+            if eof:
+                raise
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def iter_pack(path, pack_format=None):
+    """Построчно читает набор ситуаций из файла: json, jsonl или csv (с колонками text, category)"""
+    if pack_format is None:
+        name = str(path).removesuffix('.gz')
+        pack_format = name.rsplit('.', 1)[-1].lower()
+
+    with _open_text(path) as stream:
+        if pack_format == 'jsonl':
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+        elif pack_format == 'json':
+            yield from _iter_json_array(stream)
+        elif pack_format == 'csv':
+            yield from csv.DictReader(stream)
+        else:
+            raise ValueError(f'Неизвестный формат набора: {pack_format}')
+
+
+def seed_situations(rows, batch_size=500, near_duplicates=False):
+    """Добавляет ситуации пачками в одной транзакции, пропуская дубли по хэшу текста.
+
+    rows - итерируемый набор словарей с ключами text и category; остальные
+    элементы пропускаются с предупреждением в журнале.
+    near_duplicates=True оставляет перефразированные дубли (синтетические наборы).
+    Возвращает (добавлено, пропущено).
+    """
+    created = 0
+    skipped = 0
+    rows = iter(rows)
+
+    with transaction.atomic():
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+
+            situations = {}
+            for row in batch:
+                if not isinstance(row, dict):
+                    logger.warning('Пропущен элемент набора: ожидается объект с text и category, получено %r', row)
+                    skipped += 1
+                    continue
+                text = str(row.get('text') or '').strip()
+                category = str(row.get('category') or '').strip()
+                if not text or category not in CATEGORIES:
+                    skipped += 1
+                    continue
+                text_hash = Situation.hash_text(text)
+                if text_hash in situations:
+                    skipped += 1
+                    continue
+                situations[text_hash] = Situation(text=text, text_hash=text_hash, category=category)
+
+            existing = set(
+                Situation.objects.filter(text_hash__in=list(situations)).values_list('text_hash', flat=True)
+            )
+            candidates = [situation for text_hash, situation in situations.items() if text_hash not in existing]
+            # Перефразированные дубли существующих ситуаций и друг друга тоже пропускаем
+            texts = (situation.text for situation in candidates)
+            if near_duplicates:
+                selected = {text: dedup.signature(text) for text in texts}
+            else:
+                selected = dict(dedup.select_new(texts))
+            new_situations = []
+            signatures = {}
+            for situation in candidates:
+                if situation.text in selected:
+                    situation.minhash = dedup.to_bytes(selected[situation.text])
+                    signatures[situation.text_hash] = selected[situation.text]
+                    new_situations.append(situation)
+            skipped += len(situations) - len(new_situations)
+
+            # ignore_conflicts - на случай параллельной вставки того же текста
+            Situation.objects.bulk_create(new_situations, ignore_conflicts=True)
+            created += len(new_situations)
+            # Следующая пачка должна видеть дубли этой
+            if signatures:
+                dedup.index_inserted(signatures)
+
+    # bulk_create не отправляет сигналы - новые строки индекс случайного выбора дочитает
+    # сразу, а другие воркеры - при следующем обновлении
+    if created:
+        get_sampler().refresh()
+    return created, skipped
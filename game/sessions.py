@@ -0,0 +1,71 @@
+import logging
+from .models import Player, Situation, GameSession
+from .deck import SeenSet
+from .sampler import get_sampler
+from .page_cache import bump_version, session_scope
+from . import leaderboard as leaderboard_service
+from . import write_queue
+
+logger = logging.getLogger(__name__)
+
+
+def start_session(player_name):
+    """Новая игровая сессия игрока (имя нормализуется, старые сессии завершаются)"""
+    # Нормализуем имя (убираем лишние пробелы, приводим к одному регистру)
+    normalized_name = ' '.join(player_name.split()).title()
+    
+    # Ищем существующего игрока или создаем нового
+    player, created = Player.objects.get_or_create(
+        name=normalized_name,
+        defaults={'name': normalized_name}
+    )
+    
+    # Если у игрока есть активные сессии, завершаем их
+    ended_ids = list(GameSession.objects.filter(player=player, is_active=True).values_list('id', flat=True))
+    if ended_ids:
+        GameSession.objects.filter(id__in=ended_ids).update(is_active=False)
+        # update() не вызывает сигналы - сбрасываем страницы результатов вручную
+        for ended_id in ended_ids:
+            bump_version(session_scope(ended_id))
+    
+    # Выбираем случайную ситуацию
+    situation = get_sampler().pick()
+    if situation is None:
+        # Если нет ситуаций, создаем базовую
+        situation = Situation.objects.create(
+            text="Вы оказались один в джунглях ночью. Вокруг слышны странные звуки.",
+            category="nature"
+        )
+    
+    # Создаем новую игровую сессию
+    game_session = GameSession.objects.create(
+        player=player,
+        situation=situation,
+        lives=3,
+        score=0
+    )
+    # Игрок попадает в таблицу лидеров сразу, с нулевым счетом
+    leaderboard_service.record_score(game_session)
+    return game_session
+
+
+def advance(game_session):
+    """Переводит сессию к новой ситуации, которую игрок еще не видел.
+
+    Когда показаны все ситуации, колода начинается заново.
+    """
+    old_situation_id = game_session.situation_id
+    seen = SeenSet.from_bytes(game_session.seen_situations)
+    seen.add(old_situation_id)
+    new_situation = get_sampler().pick(exclude_id=old_situation_id, seen=seen)
+    if new_situation is None:
+        seen = SeenSet([old_situation_id])
+        new_situation = get_sampler().pick(exclude_id=old_situation_id, seen=seen) or game_session.situation
+    
+    # Сохраняем только ситуацию и колоду, чтобы не затереть счет, обновленный параллельно
+    game_session.situation = new_situation
+    game_session.seen_situations = seen.to_bytes()
+    write_queue.run(lambda: game_session.save(update_fields=['situation', 'seen_situations']))
+    
+    logger.debug("Changed situation from %s to %s", old_situation_id, new_situation.id)
+    return game_session
@@ -0,0 +1,49 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from . import dedup
+from .models import GameSession, PlayerAction, Situation
+from .page_cache import bump_version, session_scope
+from .sampler import get_sampler
+
+
+@receiver(post_save, sender=Situation)
+def add_situation_to_index(sender, instance, created, **kwargs):
+    """Новая ситуация попадает в индекс случайного выбора и индекс дублей после фиксации.
+
+    До фиксации транзакция (например, групповая в очереди записи) еще может
+    откатиться, и в индексах остался бы id несуществующей строки.
+    """
+    if not created:
+        return
+    situation_id, category, minhash, reserved = instance.id, instance.category, instance.minhash, instance.is_reserved
+
+    def add():
+        if not reserved:
+            get_sampler().add(situation_id, category)
+        if minhash is not None:
+            dedup.get_index().add(situation_id, dedup.from_bytes(minhash))
+
+    transaction.on_commit(add)
+
+
+@receiver(post_delete, sender=Situation)
+def remove_situation_from_index(sender, instance, **kwargs):
+    situation_id = instance.id
+
+    def remove():
+        get_sampler().remove(situation_id)
+        dedup.get_index().remove(situation_id)
+
+    transaction.on_commit(remove)
+
+
+@receiver(post_save, sender=GameSession)
+def invalidate_session_pages(sender, instance, **kwargs):
+    """Страницы сессии (результат раунда) строятся заново после ее изменения"""
+    bump_version(session_scope(instance.id))
+
+
+@receiver(post_save, sender=PlayerAction)
+def invalidate_action_session_pages(sender, instance, **kwargs):
+    bump_version(session_scope(instance.game_session_id))
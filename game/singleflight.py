@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import LLMLease
+
+
+def make_key(*parts):
+    """Хэш запроса: одинаковые запросы получают одинаковый ключ"""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Одновременные вызовы с одним ключом выполняются один раз, результат получают все"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+
+        if not is_leader:
+            call.event.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+def _lease_owner():
+    return f'{os.getpid()}-{uuid.uuid4().hex[:12]}'
+
+
+def _run_with_lease(key, fn):
+    """Склейка между процессами через таблицу аренд.
+
+    Первый воркер создает аренду и выполняет запрос, остальные опрашивают
+    ее, пока не появится результат. Если владелец пропал и аренда истекла,
+    запрос выполняется самостоятельно.
+    """
+    now = timezone.now()
+    LLMLease.objects.filter(key=key, expires_at__lt=now).delete()
+
+    owner = _lease_owner()
+    try:
+        # Точка сохранения: конфликт не должен испортить уже открытую транзакцию
+        with transaction.atomic():
+            LLMLease.objects.create(
+                key=key,
+                owner=owner,
+                expires_at=now + timedelta(seconds=settings.LLM_SINGLEFLIGHT_LEASE)
+            )
+    except IntegrityError:
+        return _wait_for_lease(key, fn)
+
+    try:
+        result = fn()
+    except Exception:
+        LLMLease.objects.filter(key=key, owner=owner).delete()
+        raise
+
+    # Результат хранится недолго - только для тех, кто уже ждет
+    LLMLease.objects.filter(key=key, owner=owner).update(
+        is_completed=True,
+        result=result,
+        expires_at=timezone.now() + timedelta(seconds=settings.LLM_SINGLEFLIGHT_RESULT_TTL)
+    )
+    return result
+
+
+def _wait_for_lease(key, fn):
+    """Ждет результат чужой аренды.
+
+    Ждущих в процессе уже склеил SingleFlight, так что опрашивает один поток;
+    пауза между опросами растет от LLM_SINGLEFLIGHT_POLL_INTERVAL до
+    LLM_SINGLEFLIGHT_POLL_MAX - долгий запрос не нагружает SQLite опросом.
+    """
+    deadline = time.monotonic() + settings.LLM_SINGLEFLIGHT_LEASE
+    delay = settings.LLM_SINGLEFLIGHT_POLL_INTERVAL
+    while time.monotonic() < deadline:
+        lease = LLMLease.objects.filter(key=key).values('is_completed', 'result', 'expires_at').first()
+        if lease is None or (not lease['is_completed'] and lease['expires_at'] < timezone.now()):
+            break
+        if lease['is_completed']:
+            return lease['result']
+        time.sleep(delay)
+        delay = min(delay * 2, settings.LLM_SINGLEFLIGHT_POLL_MAX)
+    return fn()
+
+
+_local = SingleFlight()
+
+
+def coalesce(key, fn):
+    """Выполняет fn один раз для всех одновременных вызовов с ключом key.
+
+    LLM_SINGLEFLIGHT: 'process' - в пределах процесса, 'db' - еще и между
+    процессами через таблицу аренд, 'off' - без склейки. Результат fn при
+    режиме 'db' должен сериализоваться в JSON.
+    """
+    mode = settings.LLM_SINGLEFLIGHT
+    if mode == 'db':
+        return _local.do(key, lambda: _run_with_lease(key, fn))
+    if mode == 'process':
+        return _local.do(key, fn)
+    return fn()
@@ -0,0 +1,90 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import dedup
+from .api_client import get_client
+from .models import Situation
+from .sampler import get_sampler
+
+
+def pool_size(category):
+    """Сколько заранее сгенерированных ситуаций ждет выдачи"""
+    return Situation.objects.filter(category=category, is_reserved=True).count()
+
+
+def claim(category):
+    """Забирает готовую ситуацию из пула. None - если пул пуст"""
+    while True:
+        situation_id = (
+            Situation.objects
+            .filter(category=category, is_reserved=True)
+            .order_by('id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if situation_id is None:
+            return None
+        # Условное обновление - одну ситуацию не получат два запроса
+        if Situation.objects.filter(id=situation_id, is_reserved=True).update(is_reserved=False):
+            situation = Situation.objects.get(id=situation_id)
+            get_sampler().add(situation.id, situation.category)
+            return situation
+
+
+class RateLimiter:
+    """Не больше rate запусков в минуту (0 - без ограничения)"""
+
+    def __init__(self, rate):
+        self.interval = 60.0 / rate if rate else 0
+        self._next_at = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+def refill(category, watermark, batch_size, workers, rate_limiter=None):
+    """Догенерирует пул категории до watermark, не больше batch_size за раз.
+
+    Возвращает число добавленных ситуаций.
+    """
+    missing = min(watermark - pool_size(category), batch_size)
+    if missing <= 0:
+        return 0
+
+    client = get_client()
+
+    def generate(_):
+        if rate_limiter:
+            rate_limiter.wait()
+        # Резервные ситуации в пул не кладем - они и так всегда доступны
+        return client.generate_situation(category, fallback=False, coalesce=False)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pool-refill') as executor:
+        texts = [text for text in executor.map(generate, range(missing)) if text]
+
+    # Перефразированные повторы уже известных ситуаций в пул не кладем
+    selected = dedup.select_new(texts)
+
+    # bulk_create не вызывает save() и сигналы - хэш, подпись и индекс обновляем сами
+    signatures = {Situation.hash_text(text): sig for text, sig in selected}
+    # Точные повторы, которых еще нет в индексе дублей (например, из другого воркера), не считаем
+    existing = set(Situation.objects.filter(text_hash__in=list(signatures)).values_list('text_hash', flat=True))
+    new_situations = []
+    for text, sig in selected:
+        text_hash = Situation.hash_text(text)
+        if text_hash not in existing:
+            new_situations.append(Situation(text=text, text_hash=text_hash, minhash=dedup.to_bytes(sig),
+                                            category=category, is_reserved=True))
+    # ignore_conflicts - на случай параллельной вставки того же текста
+    Situation.objects.bulk_create(new_situations, ignore_conflicts=True)
+    if signatures:
+        dedup.index_inserted(signatures)
+    return len(new_situations)
@@ -0,0 +1,31 @@
+import re
+from contextlib import contextmanager
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryAuditMixin:
+    """Проверки для TestCase: число SQL-запросов и планы выполнения (EXPLAIN)"""
+
+    @contextmanager
+    def assertMaxQueries(self, limit):
+        """Блок выполняет не больше limit запросов"""
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        queries = '\n'.join(query['sql'] for query in context.captured_queries)
+        self.assertLessEqual(
+            len(context), limit,
+            f'{len(context)} запросов при лимите {limit}:\n{queries}'
+        )
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        """Запрос не читает таблицу целиком (и использует index_name, если указан).
+
+        Разбирает план SQLite: "SCAN <таблица>" без "USING INDEX" - полный перебор строк.
+        """
+        plan = queryset.explain()
+        table = queryset.model._meta.db_table
+        full_scan = re.search(rf'\bSCAN {table}\b(?! USING (COVERING )?INDEX)', plan)
+        self.assertIsNone(full_scan, f'Полный перебор {table}:\n{plan}')
+        if index_name:
+            self.assertIn(index_name, plan)
@@ -1,3 +1,984 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import marshal
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from unittest import mock, skipIf
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from datetime import timedelta
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from . import api_client
+from .api_client import CircuitBreaker, DeepSeekClient
+from .batching import EvaluationBatcher
+from . import analytics
+from . import dedup
+from . import evaluation
+from . import export
+from . import leaderboard
+from . import ratelimit
+from . import replay
+from . import scorer
+from . import sessions
+from . import singleflight
+from . import situation_pool
+from .benchmark import runner
+from .benchmark.fake_llm import FakeLLMServer
+from .leaderboard import ALL_TIME_START
+from .models import BestScore, GameSession, LLMLease, Player, PlayerAction, RequestProfile, Situation
+from .page_cache import bump_version, get_version, session_scope
+from .sampler import SituationSampler, get_sampler
+from .seeding import _iter_json_array, iter_pack, seed_situations
+from .verdict_cache import DjangoCacheVerdictBackend, VerdictCache
+from .write_queue import WriteQueue
+from .testing import QueryAuditMixin
 
-# Create your tests here.
+
+@override_settings(DEEPSEEK_API_KEY=None, EVALUATION_MODE='sync', SURVIVAL_SCORER_PATH='')
+class ViewQueryTests(QueryAuditMixin, TestCase):
+    """Число запросов на горячих страницах игры"""
+
+    def setUp(self):
+        cache.clear()
+        get_sampler().invalidate()
+        for i in range(5):
+            Situation.objects.create(text=f'Ситуация {i}', category='nature')
+        self.client.post(reverse('start_game'), {'player_name': 'Тест'})
+        self.game_session = GameSession.objects.get()
+
+    def test_start_game(self):
+        with self.assertMaxQueries(12):
+            self.client.post(reverse('start_game'), {'player_name': 'Тест'})
+
+    def test_game_page(self):
+        with self.assertMaxQueries(4):
+            self.client.get(reverse('game_page', args=[self.game_session.id]))
+
+    def test_submit_action(self):
+        # Выживание - самый дорогой путь: обновляется таблица лидеров
+        with mock.patch.object(DeepSeekClient, '_get_strict_fallback_evaluation', return_value=(True, 'Выжил')):
+            with self.assertMaxQueries(12):
+                self.client.post(reverse('submit_action', args=[self.game_session.id]), {'action_text': 'Ищу укрытие'})
+
+    def test_submit_action_death(self):
+        with mock.patch.object(DeepSeekClient, '_get_strict_fallback_evaluation', return_value=(False, 'Погиб')):
+            with self.assertMaxQueries(8):
+                self.client.post(reverse('submit_action', args=[self.game_session.id]), {'action_text': 'Ищу укрытие'})
+
+    def test_result_page(self):
+        self.client.post(reverse('submit_action', args=[self.game_session.id]), {'action_text': 'Ищу укрытие'})
+        with self.assertMaxQueries(4):
+            self.client.get(reverse('result_page', args=[self.game_session.id]))
+
+    def test_result_page_cached(self):
+        self.client.post(reverse('submit_action', args=[self.game_session.id]), {'action_text': 'Ищу укрытие'})
+        GameSession.objects.filter(id=self.game_session.id).update(is_active=False)
+        url = reverse('result_page', args=[self.game_session.id])
+        etag = self.client.get(url)['ETag']
+        # Завершенная игра отдается из кэша, остается только проверка версии
+        with self.assertMaxQueries(2):
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version(session_scope(self.game_session.id))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_active_result_page_not_cached(self):
+        self.client.post(reverse('submit_action', args=[self.game_session.id]), {'action_text': 'Ищу укрытие'})
+        response = self.client.get(reverse('result_page', args=[self.game_session.id]))
+        self.assertNotIn('ETag', response)
+
+    def test_pending_page_not_cached(self):
+        action = PlayerAction.objects.create(game_session=self.game_session, action_text='Ищу укрытие',
+                                             is_pending=True)
+        url = reverse('result_page', args=[self.game_session.id])
+        self.assertTemplateUsed(self.client.get(url), 'game/pending.html')
+        # Вердикт записан другим процессом: версия в кэше этого процесса не сброшена
+        PlayerAction.objects.filter(id=action.id).update(is_pending=False, survived=True, feedback='Выжил')
+        GameSession.objects.filter(id=self.game_session.id).update(is_active=False)
+        self.assertTemplateUsed(self.client.get(url), 'game/result.html')
+
+    def test_version_bumped_after_commit(self):
+        scope = session_scope(self.game_session.id)
+        version = get_version(scope)
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_version(scope)
+            self.assertEqual(get_version(scope), version)
+        self.assertNotEqual(get_version(scope), version)
+
+    def test_next_situation(self):
+        with self.assertMaxQueries(4):
+            self.client.get(reverse('next_situation', args=[self.game_session.id]))
+
+    def test_leaderboard(self):
+        with self.assertMaxQueries(1):
+            self.client.get(reverse('leaderboard'))
+        # Повторный показ - из кэша
+        with self.assertMaxQueries(0):
+            self.client.get(reverse('leaderboard'))
+
+
+@override_settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='metrics-token')
+class MetricsAccessTests(TestCase):
+    """/metrics закрыт для посторонних"""
+
+    def test_anonymous_forbidden(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer wrong-token'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_token_and_staff_allowed(self):
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer metrics-token'})
+        self.assertEqual(response.status_code, 200)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_allowed_ip(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+@override_settings(DEEPSEEK_API_KEY=None, EVALUATION_MODE='sync', SURVIVAL_SCORER_PATH='')
+class GameApiTests(QueryAuditMixin, TestCase):
+    """JSON API игрового цикла"""
+
+    def setUp(self):
+        cache.clear()
+        get_sampler().invalidate()
+        for i in range(5):
+            Situation.objects.create(text=f'Ситуация {i}', category='nature')
+        response = self.client.post(reverse('api_start'), {'player_name': 'Бот'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.session_id = response.json()['session']['id']
+
+    def test_act_returns_verdict_and_next_situation(self):
+        url = reverse('api_act', args=[self.session_id])
+        with mock.patch.object(DeepSeekClient, '_get_strict_fallback_evaluation', return_value=(True, 'Выжил')):
+            with self.assertMaxQueries(12):
+                data = self.client.post(url, {'action': 'Ищу укрытие'}, content_type='application/json').json()
+        self.assertEqual(data['session']['score'], 1)
+        self.assertTrue(data['verdict']['survived'])
+        self.assertEqual(data['situation']['id'], GameSession.objects.get().situation_id)
+
+    def test_form_post_rejected(self):
+        response = self.client.post(reverse('api_act', args=[self.session_id]), {'action': 'Ищу укрытие'})
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(PlayerAction.objects.exists())
+
+    def test_state(self):
+        with self.assertMaxQueries(2):
+            data = self.client.get(reverse('api_state', args=[self.session_id])).json()
+        self.assertEqual(data['session']['lives'], 3)
+        self.assertIsNone(data['verdict'])
+
+
+@override_settings(DEEPSEEK_API_KEY=None, EVALUATION_MODE='async', SURVIVAL_SCORER_PATH='')
+class PendingActionTests(TestCase):
+    """Ожидающее действие не блокирует сессию навсегда"""
+
+    def setUp(self):
+        get_sampler().invalidate()
+        Situation.objects.create(text='Ситуация', category='nature')
+        self.game_session = sessions.start_session('Тест')
+        self.action = evaluation.submit(self.game_session, 'Ищу укрытие')
+
+    def test_second_pending_action_rejected(self):
+        with self.assertRaises(evaluation.ActionPending):
+            evaluation.submit(self.game_session, 'Зову на помощь')
+
+    @mock.patch('game.evaluation.connections')
+    def test_failed_background_evaluation_uses_fallback(self, connections):
+        with mock.patch.object(DeepSeekClient, 'evaluate_survival_plan', side_effect=RuntimeError), \
+                self.assertLogs('game.evaluation', 'ERROR'):
+            evaluation._evaluate_in_background(self.action.id)
+        self.action.refresh_from_db()
+        self.assertFalse(self.action.is_pending)
+        self.assertEqual(self.action.verdict_source, 'fallback')
+
+    def test_stale_action_resolved(self):
+        PlayerAction.objects.filter(id=self.action.id).update(created_at=timezone.now() - timedelta(hours=1))
+        with self.assertLogs('game.evaluation', 'WARNING'):
+            self.assertIsNone(evaluation.pending_action(self.game_session))
+        self.action.refresh_from_db()
+        self.assertFalse(self.action.is_pending)
+
+
+@override_settings(DEEPSEEK_API_KEY=None, EVALUATION_MODE='stream', SURVIVAL_SCORER_PATH='')
+class StreamActionTests(TestCase):
+    """SSE-поток оценивает действие под арендой"""
+
+    def setUp(self):
+        get_sampler().invalidate()
+        Situation.objects.create(text='Ситуация', category='nature')
+        self.game_session = sessions.start_session('Тест')
+        self.action = evaluation.submit(self.game_session, 'Ищу укрытие')
+        self.url = reverse('stream_action', args=[self.game_session.id])
+
+    def test_stream_completes_action(self):
+        response = self.client.get(self.url)
+        # Под WSGI поток синхронный - события уходят по мере генерации
+        self.assertFalse(response.is_async)
+        self.assertIn(b'event: verdict', b''.join(response.streaming_content))
+        self.action.refresh_from_db()
+        self.assertFalse(self.action.is_pending)
+
+    def test_second_stream_does_not_evaluate(self):
+        self.assertTrue(evaluation.claim(self.action))
+        self.assertEqual(self.client.get(self.url).status_code, 204)
+
+    def test_dropped_stream_falls_back_to_background(self):
+        def events(*args):
+            yield 'token', 'Вы '
+            yield 'token', 'ищете укрытие'
+
+        with mock.patch.object(DeepSeekClient, 'stream_evaluation', side_effect=events):
+            response = self.client.get(self.url)
+            next(iter(response.streaming_content))
+            response.close()
+        # Оборванный поток отдал аренду - опрос статуса запускает фоновую оценку
+        PlayerAction.objects.filter(id=self.action.id).update(created_at=timezone.now() - timedelta(seconds=30))
+        with mock.patch.object(evaluation, 'get_executor') as get_executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.get(reverse('action_status', args=[self.game_session.id]))
+        get_executor.return_value.submit.assert_called_once_with(evaluation._evaluate_in_background, self.action.id)
+
+
+@override_settings(DEEPSEEK_API_KEY=None, EVALUATION_MODE='sync', SURVIVAL_SCORER_PATH='',
+                   RATE_LIMITS={'submit': {'player': (60, 1)}})
+class RateLimitTests(TestCase):
+    """Лимит частоты ходов игрока"""
+
+    def setUp(self):
+        cache.clear()
+        get_sampler().invalidate()
+        Situation.objects.create(text='Ситуация', category='nature')
+        self.client.post(reverse('start_game'), {'player_name': 'Тест'})
+        self.url = reverse('submit_action', args=[GameSession.objects.get().id])
+
+    def test_submit_limited(self):
+        self.assertEqual(self.client.post(self.url, {'action_text': 'Ищу укрытие'}).status_code, 302)
+        response = self.client.post(self.url, {'action_text': 'Ищу укрытие'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+@override_settings(LLM_MAX_INFLIGHT=2, LLM_INFLIGHT_TTL=60)
+class UpstreamSlotTests(SimpleTestCase):
+    """Аренда мест среди одновременных запросов к API"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_limit_and_release(self):
+        first = ratelimit.acquire_upstream_slot()
+        second = ratelimit.acquire_upstream_slot()
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIsNone(ratelimit.acquire_upstream_slot())
+        ratelimit.release_upstream_slot(first)
+        self.assertIsNotNone(ratelimit.acquire_upstream_slot())
+
+    def test_late_release_keeps_new_lease(self):
+        ratelimit.acquire_upstream_slot()
+        stale = ratelimit.acquire_upstream_slot()
+        # Аренда истекла, место занял другой запрос
+        cache.delete(stale.rpartition(':')[0])
+        fresh = ratelimit.acquire_upstream_slot()
+        ratelimit.release_upstream_slot(stale)
+        self.assertIsNone(ratelimit.acquire_upstream_slot())
+        ratelimit.release_upstream_slot(fresh)
+        self.assertIsNotNone(ratelimit.acquire_upstream_slot())
+
+
+class DedupTests(TestCase):
+    """Почти одинаковые ситуации не добавляются повторно"""
+
+    TEXT = 'Вы заблудились в густом лесу, солнце садится, а в кармане только спички и нож.'
+
+    def setUp(self):
+        dedup.get_index().invalidate()
+        self.situation = Situation.objects.create(text=self.TEXT, category='nature')
+
+    def test_paraphrase_found(self):
+        paraphrase = 'Вы заблудились в густом лесу, солнце уже садится, а в кармане лишь спички и нож!'
+        self.assertEqual(dedup.find_duplicate(paraphrase), self.situation.id)
+        self.assertIsNone(dedup.find_duplicate('На корабле начался пожар, шлюпки уже спущены на воду.'))
+
+    def test_create_situation_skips_duplicate(self):
+        response = self.client.post(reverse('create_situation'),
+                                    {'situation_text': self.TEXT.upper(), 'category': 'nature'})
+        self.assertContains(response, 'очень похожая ситуация уже есть')
+        self.assertEqual(Situation.objects.count(), 1)
+
+    def test_change_during_rebuild_kept(self):
+        index = dedup.get_index()
+        index.invalidate()
+        sig = dedup.signature('На корабле начался пожар, шлюпки уже спущены на воду.')
+        from_bytes = dedup.from_bytes
+
+        def from_bytes_with_signal(data):
+            # Сигнал о новой ситуации пришел, пока индекс читается из БД
+            index.add(999, sig)
+            return from_bytes(data)
+
+        with mock.patch('game.dedup.from_bytes', from_bytes_with_signal):
+            index.find(sig)
+        self.assertEqual(index.find(sig)[0], 999)
+        self.assertEqual(index.find(dedup.signature(self.TEXT))[0], self.situation.id)
+
+    def test_seed_skips_non_objects(self):
+        rows = [['текст', 'nature'], 'текст', {'text': 'На корабле начался пожар, шлюпки уже спущены на воду.',
+                                             'category': 'disaster'}]
+        with self.assertLogs('game.seeding', 'WARNING'):
+            self.assertEqual(seed_situations(rows), (1, 2))
+
+    def test_seed_near_duplicates_kept(self):
+        # Так наполняет базу нагрузочный тест: варианты одного текста
+        rows = [{'text': f'{self.TEXT} (вариант {number})', 'category': 'nature'} for number in range(3)]
+        self.assertEqual(seed_situations(rows), (0, 3))
+        self.assertEqual(seed_situations(rows, near_duplicates=True), (3, 0))
+
+    def test_text_change_updates_signature(self):
+        self.situation.text = 'На корабле начался пожар, шлюпки уже спущены на воду.'
+        self.situation.save(update_fields=['text'])
+        self.situation.refresh_from_db()
+        self.assertEqual(self.situation.text_hash, Situation.hash_text(self.situation.text))
+        dedup.get_index().invalidate()
+        self.assertEqual(dedup.find_duplicate(self.situation.text), self.situation.id)
+        self.assertIsNone(dedup.find_duplicate(self.TEXT))
+
+
+class SeedPackTests(SimpleTestCase):
+    """Чтение наборов ситуаций из файлов"""
+
+    ROWS = [{'text': 'Вы в лесу, "солнце" садится', 'category': 'nature'},
+            {'text': 'Пожар на корабле, шлюпки спущены', 'category': 'disaster'}]
+
+    def write_pack(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        data = content.encode('utf-8')
+        with open(path, 'wb') as pack_file:
+            pack_file.write(gzip.compress(data) if suffix.endswith('.gz') else data)
+        return path
+
+    def test_json_array_across_chunks(self):
+        # Каждый объект длиннее куска и читается за несколько раз
+        stream = io.StringIO(' [\n' + ' ,\n'.join(json.dumps(row, ensure_ascii=False) for row in self.ROWS) + ']')
+        self.assertEqual(list(_iter_json_array(stream, chunk_size=7)), self.ROWS)
+
+    def test_unclosed_json_array(self):
+        with self.assertRaises(ValueError):
+            list(_iter_json_array(io.StringIO(json.dumps(self.ROWS)[:-1]), chunk_size=7))
+        with self.assertRaises(ValueError):
+            list(_iter_json_array(io.StringIO('{"text": "не массив"}')))
+
+    def test_formats(self):
+        jsonl = '\n'.join(json.dumps(row, ensure_ascii=False) for row in self.ROWS) + '\n\n'
+        csv_text = 'text,category\r\n' + ''.join(
+            '"{}",{}\r\n'.format(row['text'].replace('"', '""'), row['category']) for row in self.ROWS
+        )
+        packs = {
+            '.json': json.dumps(self.ROWS, ensure_ascii=False),
+            '.jsonl': jsonl,
+            '.csv': csv_text,
+            '.json.gz': json.dumps(self.ROWS, ensure_ascii=False),
+            '.jsonl.gz': jsonl,
+            '.csv.gz': csv_text,
+        }
+        for suffix, content in packs.items():
+            with self.subTest(suffix=suffix):
+                self.assertEqual(list(iter_pack(self.write_pack(suffix, content))), self.ROWS)
+
+    def test_explicit_format(self):
+        path = self.write_pack('.txt', json.dumps(self.ROWS[0], ensure_ascii=False))
+        self.assertEqual(list(iter_pack(path, 'jsonl')), self.ROWS[:1])
+        with self.assertRaises(ValueError):
+            list(iter_pack(path))
+
+
+class LeaderboardTests(TestCase):
+    """Таблицы лидеров обновляются только при реальном изменении"""
+
+    def setUp(self):
+        cache.clear()
+        situation = Situation.objects.create(text='Ситуация', category='nature')
+        player = Player.objects.create(name='Игрок')
+        self.game_session = GameSession.objects.create(player=player, situation=situation, score=3)
+        self.rival = GameSession.objects.create(player=player, situation=situation, score=10)
+
+    def test_ignored_insert_not_counted(self):
+        key = leaderboard.board_key('all')
+        version = leaderboard.get_version(key)
+        bulk_create = BestScore.objects.bulk_create
+
+        def racing_bulk_create(entries, **kwargs):
+            # Параллельный запрос успел записать лучший результат раньше
+            for entry in entries:
+                BestScore.objects.create(player=entry.player, session=self.rival, period=entry.period,
+                                         period_start=entry.period_start, category=entry.category, score=10)
+            return bulk_create(entries, **kwargs)
+
+        with mock.patch.object(BestScore.objects, 'bulk_create', racing_bulk_create):
+            with self.captureOnCommitCallbacks(execute=True):
+                leaderboard.record_score(self.game_session)
+        self.assertEqual(leaderboard.get_version(key), version)
+        self.assertEqual(set(BestScore.objects.values_list('score', flat=True)), {10})
+
+    def test_new_best_counted(self):
+        key = leaderboard.board_key('all')
+        version = leaderboard.get_version(key)
+        with self.captureOnCommitCallbacks(execute=True):
+            leaderboard.record_score(self.game_session)
+        self.assertEqual(leaderboard.get_version(key), version + 1)
+
+
+@override_settings(LLM_SINGLEFLIGHT='db', LLM_SINGLEFLIGHT_LEASE=10,
+                   LLM_SINGLEFLIGHT_POLL_INTERVAL=0.05, LLM_SINGLEFLIGHT_POLL_MAX=0.2)
+class SingleFlightLeaseTests(TestCase):
+    """Склейка одинаковых запросов между воркерами через таблицу аренд"""
+
+    def lease(self, **fields):
+        return LLMLease.objects.create(key='ключ', owner='другой-воркер', **fields)
+
+    def test_leader_stores_result(self):
+        self.assertEqual(singleflight.coalesce('ключ', lambda: {'survived': True}), {'survived': True})
+        self.assertTrue(LLMLease.objects.get(key='ключ').is_completed)
+
+    @mock.patch('game.singleflight.time.sleep')
+    def test_waiter_polls_with_backoff(self, sleep):
+        lease = self.lease(expires_at=timezone.now() + timedelta(seconds=10))
+
+        def complete_later(delay):
+            if sleep.call_count == 4:
+                LLMLease.objects.filter(id=lease.id).update(is_completed=True, result='готово')
+
+        sleep.side_effect = complete_later
+        fn = mock.Mock()
+        self.assertEqual(singleflight.coalesce('ключ', fn), 'готово')
+        fn.assert_not_called()
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.05, 0.1, 0.2, 0.2])
+
+    def test_expired_lease_runs_itself(self):
+        self.lease(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(singleflight.coalesce('ключ', lambda: 'сам'), 'сам')
+
+
+class SituationPoolTests(TestCase):
+    """Пул заранее сгенерированных ситуаций"""
+
+    def setUp(self):
+        self.old_text = 'Вы заблудились в густом лесу, солнце садится, а в кармане только спички и нож.'
+        Situation.objects.create(text=self.old_text, category='nature')
+
+    def test_refill_counts_only_inserted(self):
+        new_text = 'На корабле начался пожар, шлюпки уже спущены на воду.'
+        client = mock.Mock()
+        client.generate_situation.side_effect = [self.old_text, new_text]
+        # Индекс дублей другого воркера еще не видел старую ситуацию
+        with mock.patch('game.situation_pool.get_client', return_value=client), \
+                mock.patch('game.situation_pool.dedup.select_new',
+                           lambda texts: [(text, dedup.signature(text)) for text in texts]):
+            self.assertEqual(situation_pool.refill('nature', watermark=2, batch_size=2, workers=1), 1)
+        self.assertEqual(situation_pool.pool_size('nature'), 1)
+
+        situation = situation_pool.claim('nature')
+        self.assertEqual(situation.text, new_text)
+        self.assertEqual(situation_pool.pool_size('nature'), 0)
+
+
+@override_settings(SITUATION_INDEX_TTL=0)
+class SamplerTests(TestCase):
+    """Индекс случайного выбора дочитывает изменения других воркеров"""
+
+    def setUp(self):
+        self.sampler = SituationSampler()
+        self.first = Situation.objects.create(text='Первая ситуация', category='nature')
+
+    def test_incremental_refresh(self):
+        self.assertEqual(self.sampler.pick(), self.first)
+        reserved = Situation.objects.create(text='Ситуация из пула', category='fantasy', is_reserved=True)
+        self.assertEqual(self.sampler.pick(category='nature'), self.first)
+        self.assertIsNone(self.sampler.pick(category='fantasy'))
+
+        # Другой воркер вставил ситуацию без сигналов и выдал ситуацию из пула
+        Situation.objects.bulk_create([Situation(text='Новая', text_hash=Situation.hash_text('Новая'),
+                                                 category='disaster')])
+        Situation.objects.filter(id=reserved.id).update(is_reserved=False)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.sampler.pick(category='disaster').text, 'Новая')
+        self.assertIn('"id" >', queries[0]['sql'])
+        self.assertEqual(self.sampler.pick(category='fantasy'), reserved)
+
+
+class DeckTests(TestCase):
+    """Ситуации сессии не повторяются, пока не показаны все"""
+
+    def setUp(self):
+        get_sampler().invalidate()
+        for number in range(4):
+            Situation.objects.create(text=f'Ситуация номер {number} в совершенно разных местах', category='nature')
+
+    def test_no_repeats_until_exhausted(self):
+        game_session = sessions.start_session('Тест')
+        shown = [game_session.situation_id]
+        for _ in range(3):
+            shown.append(sessions.advance(game_session).situation_id)
+        self.assertEqual(len(set(shown)), 4)
+        # Колода пройдена - начинается заново, но текущая ситуация не повторяется сразу
+        self.assertNotEqual(sessions.advance(game_session).situation_id, shown[-1])
+
+
+class AdminTests(QueryAuditMixin, TestCase):
+    """Списки больших таблиц в админке не зависят от числа строк"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        situation = Situation.objects.create(text='Ситуация', category='nature')
+        for number in range(5):
+            game_session = GameSession.objects.create(player=Player.objects.create(name=f'Игрок {number}'),
+                                                      situation=situation)
+            for survived in (True, False):
+                PlayerAction.objects.create(game_session=game_session, situation=situation,
+                                            action_text='План', survived=survived, feedback='')
+
+    def test_action_changelist(self):
+        with self.assertMaxQueries(8):
+            response = self.client.get(reverse('admin:game_playeraction_changelist'))
+        self.assertContains(response, 'Игрок 4')
+
+    def test_export(self):
+        url = reverse('admin:game_playeraction_export')
+        response = self.client.get(url, {'format': 'jsonl'})
+        rows = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0]['situation_category'], 'nature')
+
+        # Следующая выгрузка с отметки - только новые действия
+        response = self.client.get(url, {'since': response['X-Export-Last-Id']})
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), b'')
+
+    def test_export_skips_stuck_pending(self):
+        actions = list(PlayerAction.objects.order_by('id'))
+        PlayerAction.objects.filter(id=actions[2].id).update(
+            is_pending=True, created_at=timezone.now() - timedelta(hours=1))
+        with self.assertLogs('game.export', 'WARNING'):
+            self.assertEqual(export.export_bounds(), (0, actions[-1].id))
+
+        # Свежее ожидающее действие по-прежнему останавливает диапазон
+        PlayerAction.objects.filter(id=actions[5].id).update(is_pending=True)
+        with self.assertLogs('game.export', 'WARNING'):
+            self.assertEqual(export.export_bounds(), (0, actions[4].id))
+
+    def test_analytics(self):
+        self.assertEqual(analytics.update_rollups(), 1)
+        response = self.client.get(reverse('admin:game_actionrollup_changelist'))
+        self.assertEqual(response.context['categories'][0]['rate'], 0.5)
+        self.assertEqual(response.context['hours'][0]['actions'], 10)
+
+
+@override_settings(PROFILE_SAMPLE_RATE=1.0, PROFILE_SLOW_THRESHOLD=0)
+class ProfilingTests(TestCase):
+    """Снимки запросов из выборки попадают в кольцевой буфер"""
+
+    def test_sampled_request_captured(self):
+        cache.clear()
+        self.client.get(reverse('leaderboard'))
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.view_name, 'leaderboard')
+        self.assertTrue(profile.queries)
+        self.assertIn('cumulative', profile.stats)
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get(reverse('admin:game_requestprofile_download', args=[profile.id]))
+        self.assertIsInstance(marshal.loads(response.content), dict)
+        self.assertContains(self.client.get(reverse('admin:game_requestprofile_changelist')), '.prof')
+
+    @override_settings(PROFILE_BUFFER_SIZE=2)
+    def test_ring_buffer_bounded(self):
+        for _ in range(3):
+            self.client.get(reverse('about'))
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        # Третий снимок занял слот самого старого
+        self.assertEqual(RequestProfile.objects.order_by('captured_at').first().slot, 1)
+
+
+class WriteQueueTests(SimpleTestCase):
+    """Поток записи с групповой фиксацией"""
+    databases = {'default'}
+
+    def test_batch_with_error_isolated(self):
+        queue = WriteQueue(max_batch=10)
+
+        def fail():
+            raise ValueError('Ошибка записи')
+
+        futures = [Future() for _ in range(3)]
+        with mock.patch.object(WriteQueue, '_write', wraps=queue._write) as write:
+            with queue._condition:
+                queue._queue.extend(zip([lambda: 1, fail, lambda: 3], futures))
+            # Поток записи запускается следующей записью и забирает все одной транзакцией
+            self.assertEqual(queue.run(lambda: 4), 4)
+        write.assert_called_once()
+        self.assertEqual(len(write.call_args.args[0]), 4)
+        self.assertEqual(futures[0].result(), 1)
+        self.assertRaises(ValueError, futures[1].result)
+        self.assertEqual(futures[2].result(), 3)
+
+    @override_settings(DB_WRITE_TIMEOUT=0.05)
+    def test_direct_write_when_writer_stuck(self):
+        queue = WriteQueue(max_batch=10)
+        calls = []
+
+        def write():
+            calls.append(1)
+            return 'записано'
+
+        with mock.patch.object(WriteQueue, '_write_loop', lambda self: time.sleep(0.2)):
+            self.assertEqual(queue.run(write), 'записано')
+        # Завершившийся поток перезапускается, отмененную запись он не повторяет
+        queue._writer.join()
+        self.assertEqual(queue.run(lambda: 'снова'), 'снова')
+        self.assertEqual(len(calls), 1)
+
+
+class QueryPlanTests(QueryAuditMixin, TestCase):
+    """Горячие запросы идут по индексам"""
+
+    def test_active_sessions_of_player(self):
+        self.assertUsesIndex(GameSession.objects.filter(player_id=1, is_active=True))
+
+    def test_latest_action_of_session(self):
+        self.assertUsesIndex(
+            PlayerAction.objects.filter(game_session_id=1).order_by('-created_at')[:1],
+            'action_session_created_idx'
+        )
+
+    def test_admin_filters(self):
+        self.assertUsesIndex(GameSession.objects.filter(is_active=True), 'session_active_created_idx')
+        self.assertUsesIndex(PlayerAction.objects.filter(verdict_source='llm'), 'action_source_created_idx')
+
+    def test_situation_by_text_hash(self):
+        self.assertUsesIndex(Situation.objects.filter(text_hash=Situation.hash_text('текст')))
+
+    def test_leaderboard_board(self):
+        self.assertUsesIndex(
+            BestScore.objects.filter(period='all', period_start=ALL_TIME_START, category='').order_by('-score')[:10],
+            'best_score_board_idx'
+        )
+
+
+class BenchmarkCompareTests(SimpleTestCase):
+    """Сравнение результатов нагрузочного теста с базовой линией"""
+
+    def result(self, rps, p95, queries):
+        return {'rps': rps, 'endpoints': {'game_page': {'p95': p95, 'queries_max': queries}}}
+
+    def test_percentile(self):
+        self.assertEqual(runner.percentile([1, 2, 3, 4, 5], 50), 3)
+        self.assertEqual(runner.percentile([1, 2], 95), 1.95)
+
+    def test_compare(self):
+        baseline = self.result(100, 0.020, 4)
+        self.assertEqual(runner.compare(self.result(95, 0.023, 4), baseline), [])
+        self.assertEqual(len(runner.compare(self.result(50, 0.100, 5), baseline)), 3)
+
+
+class DjangoCacheVerdictTests(SimpleTestCase):
+    """Кэш вердиктов в отдельном псевдониме кэша Django"""
+
+    def setUp(self):
+        self.verdicts = VerdictCache(DjangoCacheVerdictBackend(100, 60))
+        self.verdicts.backend.clear()
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.verdicts.get(1, 'Бегу к реке'))
+        self.verdicts.set(1, 'Бегу к реке', True, 'Спасся', 0.5)
+        self.assertEqual(self.verdicts.get(1, 'бегу  к реке!'), (True, 'Спасся'))
+        self.assertIsNone(self.verdicts.get(2, 'Бегу к реке'))
+        stats = self.verdicts.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['saved_seconds']), (1, 2, 0.5))
+
+    def test_ttl(self):
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=1000):
+            self.verdicts.set(1, 'Бегу к реке', True, 'Спасся', 0.5)
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=1059):
+            self.assertIsNotNone(self.verdicts.get(1, 'Бегу к реке'))
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=1061):
+            self.assertIsNone(self.verdicts.get(1, 'Бегу к реке'))
+
+    def test_clear_keeps_default_cache(self):
+        cache.set('page:version', 1)
+        self.verdicts.set(1, 'Бегу к реке', True, 'Спасся', 0.5)
+        self.verdicts.backend.clear()
+        self.assertIsNone(self.verdicts.get(1, 'Бегу к реке'))
+        self.assertEqual(cache.get('page:version'), 1)
+
+
+class ReplayTests(SimpleTestCase):
+    """Учет токенов и согласия при прогоне истории"""
+
+    def test_usage_accounting(self):
+        messages = lambda situation_text, player_plan: [{'content': 'а' * 9}, {'content': player_plan}]
+        verdicts = iter([(True, 'Выжил'), (None, '')])
+        with mock.patch.object(replay, '_messages', messages), \
+                mock.patch.object(replay, '_evaluator', lambda situation_text, player_plan: next(verdicts)):
+            decided = replay.replay_one((1, 'Ситуация', 'Ищу укрытие', True))
+            undecided = replay.replay_one((2, None, 'Бегу', False))
+        self.assertEqual((decided['prompt_tokens'], decided['completion_tokens']), (3 + 4, 2))
+        self.assertTrue(decided['agree'])
+        self.assertIsNone(undecided['agree'])
+
+        summary = replay.ReplaySummary()
+        summary.add(decided)
+        summary.add(undecided)
+        result = summary.as_dict()
+        self.assertEqual((result['total'], result['decided'], result['undecided']), (2, 1, 1))
+        self.assertEqual(result['agreement'], 1.0)
+        self.assertEqual(result['prompt_tokens'], 3 + 4 + 3 + 2)
+        self.assertEqual(result['completion_tokens'], 2)
+
+
+class ReplayCommandTests(TestCase):
+    """Прогон истории командой replay_actions"""
+
+    def setUp(self):
+        game_session = sessions.start_session('Тест')
+        # Действие до появления источника вердикта и ситуации в записи
+        PlayerAction.objects.create(game_session=game_session, action_text='Ищу укрытие', survived=True)
+
+    def test_historical_actions_replayed_by_default(self):
+        stdout = io.StringIO()
+        call_command('replay_actions', backend='fallback', stdout=stdout)
+        self.assertIn('Действий: 1', stdout.getvalue())
+
+    def test_no_matching_actions(self):
+        with self.assertRaises(CommandError):
+            call_command('replay_actions', backend='fallback', source='llm', stdout=io.StringIO())
+
+
+class ScorerTests(SimpleTestCase):
+    """Локальная модель оценки планов"""
+
+    def setUp(self):
+        good = ['найду укрытие', 'подам сигнал', 'позову спасателей', 'разведу огонь']
+        bad = ['побегу', 'сдамся', 'буду кричать', 'использую магию']
+        plans = [f'{first} и {second}' for first in good for second in good if first != second]
+        plans += [f'{first} и {second}' for first in bad for second in bad if first != second]
+        self.model = scorer.train(plans, [True] * 12 + [False] * 12, epochs=100)
+
+        handle, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.model.save(self.path)
+
+    def test_predict(self):
+        self.assertTrue(self.model.predict('найду укрытие и подам сигнал', 0.8))
+        self.assertFalse(self.model.predict('побегу и буду кричать', 0.8))
+        self.assertIsNone(self.model.predict('пойду домой', 0.8))
+
+    def test_confident_verdict_skips_api(self):
+        with override_settings(SURVIVAL_SCORER_PATH=self.path, SURVIVAL_SCORER_CONFIDENCE=0.8):
+            with mock.patch.object(DeepSeekClient, '_request_evaluation') as request_evaluation:
+                verdict = DeepSeekClient().evaluate_survival_plan('Ситуация', 'найду укрытие и подам сигнал')
+        request_evaluation.assert_not_called()
+        self.assertTrue(verdict[0])
+        self.assertEqual(verdict.source, 'scorer')
+
+    def test_model_file_checked_on_interval(self):
+        with override_settings(SURVIVAL_SCORER_PATH=self.path, SURVIVAL_SCORER_CHECK_INTERVAL=60):
+            with mock.patch('game.scorer.os.stat', wraps=os.stat) as stat:
+                first = scorer.get_scorer()
+                self.assertIs(scorer.get_scorer(), first)
+                self.assertEqual(stat.call_count, 1)
+                with mock.patch('game.scorer.time.monotonic', return_value=time.monotonic() + 61):
+                    scorer.get_scorer()
+                self.assertEqual(stat.call_count, 2)
+
+    def test_corrupt_model_file_ignored(self):
+        with open(self.path, 'w', encoding='utf-8') as model_file:
+            model_file.write('{"weights": ')
+        with override_settings(SURVIVAL_SCORER_PATH=self.path, SURVIVAL_SCORER_CHECK_INTERVAL=0), \
+                self.assertLogs('game.scorer', 'ERROR'):
+            self.assertIsNone(scorer.get_scorer())
+
+    def test_python_training(self):
+        vectors = [scorer.features(plan) for plan in ['найду укрытие', 'побегу']]
+        weights, bias = scorer._train_python(vectors, [1.0, 0.0], 50, 1.0, 1e-4)
+        model = scorer.LinearScorer(weights, bias)
+        self.assertGreater(model.probability('найду укрытие'), 0.5)
+        self.assertLess(model.probability('побегу'), 0.5)
+
+    @skipIf(scorer.numpy is None, 'NumPy не установлен')
+    def test_numpy_matches_python(self):
+        vectors = [scorer.features(plan) for plan in ['найду укрытие', 'побегу', 'подам сигнал']]
+        targets = [1.0, 0.0, 1.0]
+        python_weights, python_bias = scorer._train_python(vectors, targets, 20, 1.0, 1e-4)
+        numpy_weights, numpy_bias = scorer._train_numpy(vectors, targets, scorer.DEFAULT_FEATURES, 20, 1.0, 1e-4)
+        self.assertAlmostEqual(python_bias, numpy_bias)
+        for index, weight in python_weights.items():
+            self.assertAlmostEqual(numpy_weights.get(index, 0.0), weight)
+
+
+class EvaluationBatcherTests(SimpleTestCase):
+    """Пачки планов для одного запроса к ИИ"""
+
+    def evaluate_concurrently(self, batcher, plans):
+        results = {}
+
+        def evaluate(plan):
+            try:
+                results[plan] = batcher.evaluate('Ситуация', plan, timeout=5)
+            except Exception as e:
+                results[plan] = e
+
+        threads = [threading.Thread(target=evaluate, args=(plan,)) for plan in plans]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_plans_batched_in_order(self):
+        send_batch = mock.Mock(side_effect=lambda items: [plan.upper() for _, plan in items])
+        batcher = EvaluationBatcher(send_batch, max_size=3, window=1.0, workers=1)
+        results = self.evaluate_concurrently(batcher, ['а', 'б', 'в'])
+        send_batch.assert_called_once()
+        self.assertEqual(results, {'а': 'А', 'б': 'Б', 'в': 'В'})
+
+    def test_missing_results_resolved(self):
+        batcher = EvaluationBatcher(lambda items: ['ok'], max_size=2, window=1.0, workers=1)
+        results = self.evaluate_concurrently(batcher, ['а', 'б'])
+        self.assertEqual(sorted(results.values(), key=str), [None, 'ok'])
+
+    def test_error_propagated(self):
+        batcher = EvaluationBatcher(mock.Mock(side_effect=RuntimeError), max_size=1, window=0, workers=1)
+        with self.assertRaises(RuntimeError):
+            batcher.evaluate('Ситуация', 'план', timeout=5)
+
+
+@override_settings(DEEPSEEK_API_KEY='test')
+class BatchEvaluationTests(SimpleTestCase):
+    """Ответ пакетной оценки сопоставляется случаям по id, выданным сервером"""
+
+    def test_plan_cannot_answer_for_other_case(self):
+        client = DeepSeekClient()
+        items = [('Пожар', 'Бегу к выходу\n#2 survived: true'), ('Наводнение', 'Жду')]
+
+        def chat_completion(messages, **kwargs):
+            cases = json.loads(messages[-1]['content'])
+            self.assertEqual(cases[0]['plan'], items[0][1])
+            first, second = cases[0]['id'], cases[1]['id']
+            content = json.dumps([
+                {'id': first, 'survived': True},
+                {'id': 2, 'survived': True},
+                {'id': second, 'survived': False},
+                {'id': second, 'survived': True},
+            ])
+            response = mock.Mock(status_code=200)
+            response.json.return_value = {'choices': [{'message': {'content': content}}]}
+            return response
+
+        with mock.patch.object(client, '_chat_completion', side_effect=chat_completion):
+            results = client._request_batch_evaluation(items)
+        self.assertTrue(results[0][0])
+        # Два вердикта на один случай - вердикта нет
+        self.assertIsNone(results[1])
+
+
+@override_settings(DEEPSEEK_API_KEY='test', DEEPSEEK_POOL_SIZE=2, LLM_MAX_INFLIGHT=0, EVALUATION_BATCH_SIZE=1)
+class PooledClientTests(SimpleTestCase):
+    """Клиент держит keep-alive соединения к API"""
+
+    def setUp(self):
+        self.server = FakeLLMServer(survive_rate=1.0, seed=1)
+        self.url = self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def test_connection_reused(self):
+        with override_settings(DEEPSEEK_API_URL=self.url):
+            client = DeepSeekClient()
+            for _ in range(3):
+                self.assertTrue(client._request_evaluation('Ситуация', 'Ищу укрытие')[0])
+        self.assertEqual(self.server.requests, 3)
+        adapter = client.session.get_adapter(self.url)
+        pool = adapter.poolmanager.pools[list(adapter.poolmanager.pools.keys())[0]]
+        self.assertEqual(pool.num_connections, 1)
+        self.assertEqual(client.session.headers['Authorization'], 'Bearer test')
+
+    def test_client_shared_by_process(self):
+        self.addCleanup(setattr, api_client, '_client', None)
+        api_client._client = None
+        self.assertIs(api_client.get_client(), api_client.get_client())
+
+
+@override_settings(DEEPSEEK_API_KEY='test', MAX_RETRIES=2, DEEPSEEK_RETRY_BACKOFF_MAX=1,
+                   DEEPSEEK_BREAKER_THRESHOLD=5, DEEPSEEK_HEDGE=False)
+class RetryTests(SimpleTestCase):
+    """Повторы, предохранитель и дублирующие запросы к API"""
+
+    def setUp(self):
+        self.client_ = DeepSeekClient()
+        self.client_.session = mock.Mock()
+
+    def response(self, status_code):
+        return mock.Mock(status_code=status_code, headers={})
+
+    @mock.patch('game.api_client.time.sleep')
+    def test_retry_until_success(self, sleep):
+        self.client_.session.post.side_effect = [self.response(503), self.response(503), self.response(200)]
+        with self.assertLogs('game.api_client', 'WARNING'):
+            response = self.client_._send_chat_completion([], max_tokens=10, temperature=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(self.client_.breaker.failures, 0)
+
+    @mock.patch('game.api_client.time.sleep')
+    def test_no_sleep_after_last_attempt(self, sleep):
+        self.client_.session.post.return_value = self.response(503)
+        with self.assertLogs('game.api_client', 'WARNING'):
+            response = self.client_._send_chat_completion([], max_tokens=10, temperature=0)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.client_.session.post.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(self.client_.breaker.failures, 1)
+
+    def test_breaker_opens_and_probes(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        with mock.patch('game.api_client.time.monotonic', return_value=time.monotonic() + 60):
+            # После паузы - один пробный запрос
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, 'closed')
+
+    @override_settings(DEEPSEEK_HEDGE=True, DEEPSEEK_HEDGE_MIN_SAMPLES=1)
+    def test_hedged_request_wins(self):
+        slow, fast = self.response(200), self.response(200)
+        calls = []
+
+        def post(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                time.sleep(0.5)
+                return slow
+            return fast
+
+        self.client_.session.post.side_effect = post
+        self.client_.latency.add(0.01)
+        self.assertIs(self.client_._send_chat_completion([], max_tokens=10, temperature=0), fast)
+        self.assertEqual(len(calls), 2)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api_views, views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -7,9 +7,17 @@ urlpatterns = [
     path('game/<int:session_id>/', views.game_page, name='game_page'),
     path('game/<int:session_id>/submit/', views.submit_action, name='submit_action'),
     path('game/<int:session_id>/result/', views.result_page, name='result_page'),
+    path('game/<int:session_id>/stream/', views.stream_action, name='stream_action'),
+    path('game/<int:session_id>/status/', views.action_status, name='action_status'),
     path('game/<int:session_id>/next/', views.next_situation, name='next_situation'),  # НОВЫЙ МАРШРУТ
     path('leaderboard/', views.leaderboard, name='leaderboard'),
     path('create_situation/', views.create_situation, name='create_situation'),
     path('about/', views.about, name='about'),
     path('generate-ai-situation/', views.generate_ai_situation, name='generate_ai_situation'),
+    path('metrics', views.metrics, name='metrics'),
+    # JSON API игрового цикла
+    path('api/start/', api_views.start, name='api_start'),
+    path('api/game/<int:session_id>/act/', api_views.act, name='api_act'),
+    path('api/game/<int:session_id>/next/', api_views.next_situation, name='api_next'),
+    path('api/game/<int:session_id>/state/', api_views.state, name='api_state'),
 ]
\ No newline at end of file
@@ -0,0 +1,134 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def normalize_plan(player_plan):
+    """Приводит план к каноническому виду: регистр, пробелы и пунктуация не важны"""
+    return ' '.join(_NON_WORD_RE.sub(' ', player_plan.lower()).split())
+
+
+def make_key(situation_id, player_plan):
+    """Ключ кэша для пары (ситуация, нормализованный план)"""
+    digest = hashlib.sha1(normalize_plan(player_plan).encode('utf-8')).hexdigest()
+    return f'{situation_id}:{digest}'
+
+
+class LocMemVerdictBackend:
+    """LRU-кэш в памяти процесса с ограничением по размеру и времени жизни"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCacheVerdictBackend:
+    """Кэш Django из псевдонима VERDICT_CACHE_ALIAS.
+
+    Общий для всех воркеров, только если псевдоним указывает на общий кэш
+    (VERDICT_REDIS_URL); с LocMemCache у каждого процесса свой.
+    """
+
+    def __init__(self, max_size, ttl):
+        # Размер ограничивает сам бэкенд кэша Django (MAX_ENTRIES)
+        self.ttl = ttl
+        self.cache = caches[settings.VERDICT_CACHE_ALIAS]
+
+    def get(self, key):
+        return self.cache.get(f'verdict:{key}')
+
+    def set(self, key, value):
+        self.cache.set(f'verdict:{key}', value, self.ttl)
+
+    def clear(self):
+        # Псевдоним отведен только под вердикты, основной кэш не затрагивается
+        self.cache.clear()
+
+
+class VerdictCache:
+    """Кэш вердиктов ИИ со счетчиками попаданий и сэкономленного времени"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, situation_id, player_plan):
+        """Возвращает (survived, feedback) или None"""
+        value = self.backend.get(make_key(situation_id, player_plan))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += value['latency']
+        return value['survived'], value['feedback']
+
+    def set(self, situation_id, player_plan, survived, feedback, latency):
+        self.backend.set(make_key(situation_id, player_plan), {
+            'survived': survived,
+            'feedback': feedback,
+            'latency': latency
+        })
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'saved_api_calls': self.hits,
+                'saved_seconds': self.saved_seconds
+            }
+
+
+_verdict_cache = None
+_verdict_cache_lock = threading.Lock()
+
+
+def get_verdict_cache():
+    """Общий для процесса кэш вердиктов (None, если кэш выключен)"""
+    global _verdict_cache
+    if not settings.VERDICT_CACHE_BACKEND:
+        return None
+    with _verdict_cache_lock:
+        if _verdict_cache is None:
+            backend_class = import_string(settings.VERDICT_CACHE_BACKEND)
+            backend = backend_class(settings.VERDICT_CACHE_SIZE, settings.VERDICT_CACHE_TTL)
+            _verdict_cache = VerdictCache(backend)
+    return _verdict_cache
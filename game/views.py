@@ -1,9 +1,23 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
-from .models import Player, Situation, GameSession, PlayerAction
-from .api_client import DeepSeekClient
-import random
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.crypto import constant_time_compare
+from .models import Situation, GameSession, PlayerAction, BestScore
+from .api_client import get_client
+from .metrics import registry
+from . import dedup
+from . import evaluation
+from . import leaderboard as leaderboard_service
+from . import ratelimit
+from . import sessions
+from . import situation_pool
+from .page_cache import cached_page, get_version, session_scope
+import json
 
+@cached_page()
 def home(request):
     """Главная страница"""
     return render(request, 'game/home.html')
@@ -16,39 +30,7 @@ def start_game(request):
         if not player_name:
             return render(request, 'game/start.html', {'error': 'Введите имя игрока'})
         
-        # Нормализуем имя (убираем лишние пробелы, приводим к одному регистру)
-        normalized_name = ' '.join(player_name.split()).title()
-        
-        # Ищем существующего игрока или создаем нового
-        player, created = Player.objects.get_or_create(
-            name=normalized_name,
-            defaults={'name': normalized_name}
-        )
-        
-        # Если у игрока есть активные сессии, завершаем их
-        active_sessions = GameSession.objects.filter(player=player, is_active=True)
-        for session in active_sessions:
-            session.is_active = False
-            session.save()
-        
-        # Выбираем случайную ситуацию
-        situations = Situation.objects.all()
-        if situations:
-            situation = random.choice(situations)
-        else:
-            # Если нет ситуаций, создаем базовую
-            situation = Situation.objects.create(
-                text="Вы оказались один в джунглях ночью. Вокруг слышны странные звуки.",
-                category="nature"
-            )
-        
-        # Создаем новую игровую сессию
-        game_session = GameSession.objects.create(
-            player=player,
-            situation=situation,
-            lives=3,
-            score=0
-        )
+        game_session = sessions.start_session(player_name)
         
         return redirect('game_page', session_id=game_session.id)
     
@@ -75,31 +57,19 @@ def submit_action(request, session_id):
         if not action_text:
             return redirect('game_page', session_id=session_id)
         
-        # Используем API для оценки
-        api_client = DeepSeekClient()
-        survived, feedback = api_client.evaluate_survival_plan(
-            game_session.situation.text, 
-            action_text
-        )
+        # Пока предыдущее действие ждет вердикта, новое не принимаем
+        if evaluation.pending_action(game_session):
+            return redirect('result_page', session_id=session_id)
         
-        # Создаем запись о действии
-        PlayerAction.objects.create(
-            game_session=game_session,
-            action_text=action_text,
-            survived=survived,
-            feedback=feedback
-        )
+        retry_after = ratelimit.check(request, 'submit', game_session.player_id)
+        if retry_after:
+            return ratelimit.too_many_requests(retry_after)
         
-        # Обновляем игровую сессию
-        if survived:
-            game_session.score += 1
-        else:
-            game_session.lives -= 1
-            
-        if game_session.lives <= 0:
-            game_session.is_active = False
-        
-        game_session.save()
+        # Оценка выполняется сразу или в фоне - в зависимости от EVALUATION_MODE
+        try:
+            evaluation.submit(game_session, action_text)
+        except evaluation.ActionPending:
+            pass
         
         return redirect('result_page', session_id=session_id)
     
@@ -113,65 +83,172 @@ def next_situation(request, session_id):
     if not game_session.is_active or game_session.lives <= 0:
         return redirect('result_page', session_id=session_id)
     
-    # Выбираем случайную ситуацию (ВСЕГДА новую)
-    situations = Situation.objects.all()
-    
-    if situations.count() > 1:
-        # Если есть больше одной ситуации, исключаем текущую
-        current_situation = game_session.situation
-        available_situations = situations.exclude(id=current_situation.id)
-        if available_situations.exists():
-            new_situation = random.choice(available_situations)
-        else:
-            new_situation = random.choice(situations)
-    else:
-        new_situation = situations.first()
-    
-    # Обновляем сессию с новой ситуацией
-    game_session.situation = new_situation
-    game_session.save()
+    # Нельзя сменить ситуацию, пока ИИ оценивает предыдущее действие
+    if evaluation.pending_action(game_session):
+        return redirect('result_page', session_id=session_id)
     
-    print(f"DEBUG: Changed situation from {game_session.situation.id} to {new_situation.id}")  # Для отладки
+    # Выбираем случайную ситуацию (ВСЕГДА новую, если есть из чего выбрать)
+    sessions.advance(game_session)
     
     return redirect('game_page', session_id=session_id)
 
+def _session_version(request, session_id):
+    """Версия страницы результата: кэшируется только завершенная игра без ожидающего вердикта.
+
+    Страницы идущей игры и ожидания меняются из других воркеров, а сбросы
+    версии без общего кэша до этого процесса не доходят.
+    """
+    finished = (
+        GameSession.objects
+        .filter(Q(is_active=False) | Q(lives__lte=0), id=session_id)
+        .exclude(playeraction__is_pending=True)
+        .exists()
+    )
+    return get_version(session_scope(session_id)) if finished else None
+
+@cached_page(_session_version)
 def result_page(request, session_id):
     """Страница с результатом раунда"""
     game_session = get_object_or_404(GameSession, id=session_id)
     latest_action = PlayerAction.objects.filter(game_session=game_session).order_by('-created_at').first()
     
+    # Вердикт еще не готов - показываем страницу ожидания, которая опрашивает статус
+    if latest_action and latest_action.is_pending:
+        return render(request, 'game/pending.html', {
+            'game_session': game_session,
+            'player_action': latest_action,
+            'stream': settings.EVALUATION_MODE == 'stream'
+        })
+    
     return render(request, 'game/result.html', {
         'game_session': game_session,
         'player_action': latest_action,
         'survived': latest_action.survived if latest_action else False
     })
 
-def leaderboard(request):
-    """Таблица лидеров - показывает лучший результат каждого игрока"""
-    # Получаем максимальный счет для каждого игрока
-    from django.db.models import Max
+def action_status(request, session_id):
+    """Статус последнего действия (AJAX-опрос страницы ожидания)"""
+    game_session = get_object_or_404(GameSession, id=session_id)
+    latest_action = PlayerAction.objects.filter(game_session=game_session).order_by('-created_at').first()
+    # Зависшее действие уходит на оценку в фон или получает резервный вердикт
+    if latest_action and latest_action.is_pending and not evaluation.resolve_stale(latest_action):
+        latest_action.refresh_from_db()
+        game_session.refresh_from_db()
     
-    best_scores = GameSession.objects.values('player__name').annotate(
-        best_score=Max('score')
-    ).order_by('-best_score')[:10]
+    return JsonResponse({
+        'pending': bool(latest_action and latest_action.is_pending),
+        'survived': latest_action.survived if latest_action else False,
+        'lives': game_session.lives,
+        'score': game_session.score,
+        'is_active': game_session.is_active
+    })
+
+async def stream_action(request, session_id):
+    """Потоковая выдача вердикта ИИ через Server-Sent Events"""
+    action = await (
+        PlayerAction.objects
+        .select_related('situation')
+        .filter(game_session_id=session_id, is_pending=True)
+        .order_by('-created_at')
+        .afirst()
+    )
+    # 204 - оценивать нечего или действие уже оценивает другой поток (вторая вкладка):
+    # браузер не переподключается и переходит к опросу статуса
+    if action is None or not await sync_to_async(evaluation.claim)(action):
+        return HttpResponse(status=204)
     
-    # Собираем информацию для отображения
-    leaders = []
-    for score_data in best_scores:
-        player_name = score_data['player__name']
-        best_score = score_data['best_score']
-        
-        # Находим сессию с этим счетом
-        best_session = GameSession.objects.filter(
-            player__name=player_name, 
-            score=best_score
-        ).order_by('-id').first()
-        
-        if best_session:
-            leaders.append(best_session)
+    # Под WSGI асинхронный итератор был бы прочитан целиком до отправки - отдаем синхронный
+    events = _verdict_events_async(action) if isinstance(request, ASGIRequest) else _verdict_events(action)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def _sse(kind, payload):
+    """Строка события SSE: кусок истории или итоговый вердикт"""
+    if kind == 'token':
+        return f"event: token\ndata: {json.dumps(payload)}\n\n"
+    return f"event: verdict\ndata: {json.dumps({'survived': payload[0]})}\n\n"
+
+def _stream_events(action):
+    return get_client().stream_evaluation(
+        action.situation.text if action.situation else '',
+        action.action_text,
+        action.situation_id
+    )
+
+def _verdict_events(action):
+    """События SSE для WSGI; оборванный поток отдает аренду - действие оценит фон"""
+    completed = False
+    try:
+        for kind, payload in _stream_events(action):
+            if kind == 'verdict':
+                survived, feedback = payload
+                # Действие сохраняется только после завершения потока
+                evaluation.complete(action, survived, feedback, evaluation.verdict_source(payload))
+                completed = True
+            yield _sse(kind, payload)
+    finally:
+        if not completed:
+            evaluation.release(action)
+
+async def _verdict_events_async(action):
+    """События SSE для ASGI: чтение ответа API блокирующее - выполняем его в потоке"""
+    events = _stream_events(action)
+    next_event = sync_to_async(next, thread_sensitive=False)
+    completed = False
+    try:
+        while True:
+            event = await next_event(events, None)
+            if event is None:
+                break
+            kind, payload = event
+            if kind == 'verdict':
+                survived, feedback = payload
+                await sync_to_async(evaluation.complete)(action, survived, feedback, evaluation.verdict_source(payload))
+                completed = True
+            yield _sse(kind, payload)
+    finally:
+        if not completed:
+            await sync_to_async(evaluation.release)(action)
+
+def _leaderboard_params(request):
+    """Период, категория и номер страницы из запроса (с проверкой значений)"""
+    period = request.GET.get('period', 'all')
+    if period not in leaderboard_service.PERIODS:
+        period = 'all'
+    category = request.GET.get('category', '')
+    if category not in dict(Situation.CATEGORY_CHOICES):
+        category = ''
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    return period, category, page
+
+def _leaderboard_version(request):
+    # Кэшируем только первую страницу: ее версия меняется, когда меняется содержимое
+    period, category, page = _leaderboard_params(request)
+    if page != 1:
+        return None
+    key = leaderboard_service.board_key(period, category)
+    return f'{key}:{leaderboard_service.get_version(key)}'
+
+@cached_page(_leaderboard_version, timeout=settings.LEADERBOARD_CACHE_TTL)
+def leaderboard(request):
+    """Таблица лидеров - показывает лучший результат каждого игрока"""
+    period, category, page = _leaderboard_params(request)
+    leaders, has_next = leaderboard_service.get_leaders(period, category, page)
     
     return render(request, 'game/leaderboard.html', {
-        'leaders': leaders
+        'leaders': leaders,
+        'period': period,
+        'category': category,
+        'page': page,
+        'has_next': has_next,
+        'rank_offset': (page - 1) * settings.LEADERBOARD_PAGE_SIZE,
+        'periods': BestScore.PERIOD_CHOICES,
+        'categories': Situation.CATEGORY_CHOICES
     })
 
 def create_situation(request):
@@ -185,16 +262,24 @@ def create_situation(request):
                 'error': 'Заполните все поля'
             })
         
-        Situation.objects.create(
-            text=text,
-            category=category,
-            is_user_created=True
-        )
+        # Такая же или почти такая же ситуация уже есть - второй раз не добавляем
+        created = False
+        if dedup.find_duplicate(text) is None:
+            _, created = Situation.objects.get_or_create(
+                text_hash=Situation.hash_text(text),
+                defaults={'text': text, 'category': category, 'is_user_created': True}
+            )
+        if not created:
+            return render(request, 'game/create_situation.html', {
+                'error': 'Такая или очень похожая ситуация уже есть - придумайте другую',
+                'situation_text': text
+            })
         
         return redirect('home')
     
     return render(request, 'game/create_situation.html')
 
+@cached_page()
 def about(request):
     """Страница о проекте"""
     return render(request, 'game/about.html')
@@ -204,20 +289,40 @@ def generate_ai_situation(request):
     if request.method == 'POST':
         category = request.POST.get('category', 'nature')
         
-        api_client = DeepSeekClient()
-        situation_text = api_client.generate_situation(category)
+        retry_after = ratelimit.check(request, 'generate')
+        if retry_after:
+            return ratelimit.too_many_requests(retry_after, json=True)
         
-        # Сохраняем в базу
-        situation = Situation.objects.create(
-            text=situation_text,
-            category=category,
-            is_user_created=False
-        )
+        # Сначала берем готовую ситуацию из пула, генерируем на месте только если он пуст
+        situation = situation_pool.claim(category)
+        if situation is None:
+            situation_text = get_client().generate_situation(category)
+            # ИИ повторил известную ситуацию другими словами - отдаем существующую
+            duplicate_id = dedup.find_duplicate(situation_text)
+            situation = Situation.objects.filter(id=duplicate_id).first() if duplicate_id else None
+            if situation is None:
+                situation, created = Situation.objects.get_or_create(
+                    text_hash=Situation.hash_text(situation_text),
+                    defaults={'text': situation_text, 'category': category, 'is_user_created': False}
+                )
         
         return JsonResponse({
             'success': True,
-            'situation': situation_text,
+            'situation': situation.text,
             'situation_id': situation.id
         })
     
-    return JsonResponse({'success': False, 'error': 'Invalid request'})
\ No newline at end of file
+    return JsonResponse({'success': False, 'error': 'Invalid request'})
+
+def metrics_allowed(request):
+    """Метрики видят персонал, адреса из METRICS_ALLOWED_IPS и запросы с METRICS_TOKEN"""
+    if request.user.is_staff or ratelimit.client_ip(request) in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    return bool(settings.METRICS_TOKEN) and constant_time_compare(token, settings.METRICS_TOKEN)
+
+def metrics(request):
+    """Метрики приложения в формате Prometheus"""
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,96 @@
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from django.conf import settings
+from django.db import connection, transaction
+
+
+class WriteQueue:
+    """Очередь записи в БД с групповой фиксацией.
+
+    SQLite допускает одного писателя, поэтому записи из всех потоков процесса
+    выполняет один поток: все, что накопилось за время предыдущей транзакции,
+    уходит одной короткой транзакцией (каждая запись - в своей точке сохранения).
+    Вызывающий ждет фиксации, так что следующий запрос увидит свои данные.
+    Если поток записи упал или не взял запись за DB_WRITE_TIMEOUT секунд,
+    вызывающий выполняет ее сам, а следующая запись запускает новый поток.
+    """
+
+    def __init__(self, max_batch):
+        self.max_batch = max_batch
+        self._queue = []
+        self._condition = threading.Condition()
+        self._writer = None
+
+    def run(self, func):
+        """Выполняет func() в потоке записи и возвращает его результат"""
+        future = Future()
+        with self._condition:
+            self._queue.append((func, future))
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name='db-writer', daemon=True)
+                self._writer.start()
+            self._condition.notify()
+        try:
+            return future.result(timeout=settings.DB_WRITE_TIMEOUT)
+        except FutureTimeout:
+            if not future.cancel():
+                # Запись уже выполняется - ее ограничивает таймаут блокировки SQLite
+                return future.result()
+        # Поток записи не взял запись: отмененную он пропустит, выполняем ее сами
+        with transaction.atomic():
+            return func()
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                batch = self._queue[:self.max_batch]
+                del self._queue[:self.max_batch]
+            batch = [(func, future) for func, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch):
+        results = []
+        try:
+            with transaction.atomic():
+                for func, _ in batch:
+                    try:
+                        # Ошибка одной записи не откатывает остальные
+                        with transaction.atomic():
+                            results.append((True, func()))
+                    except Exception as e:
+                        results.append((False, e))
+        except Exception as e:
+            # Не удалась сама фиксация - не записалось ничего
+            results = [(False, e)] * len(batch)
+            connection.close()
+
+        for (_, future), (ok, value) in zip(batch, results):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def run(func):
+    """Выполняет запись func() через очередь записи (DB_WRITE_QUEUE) или сразу.
+
+    Внутри уже открытой транзакции запись выполняется на месте: поток записи
+    не увидел бы ее незафиксированных данных.
+    """
+    global _write_queue
+    if connection.in_atomic_block:
+        return func()
+    if not settings.DB_WRITE_QUEUE:
+        with transaction.atomic():
+            return func()
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteQueue(settings.DB_WRITE_BATCH)
+    return _write_queue.run(func)